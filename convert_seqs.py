@@ -0,0 +1,27 @@
+# -----------------------------------------------------------------------------
+# pyDM404 - A cross platform Drum Sequencer
+# File: convert_seqs.py - convert disks from sequences.npy to the sequences.seq format
+#
+# Usage: python convert_seqs.py DISKS/demo [DISKS/other ...]
+# -----------------------------------------------------------------------------
+
+import sys
+from pathlib import Path
+
+from pydm.core import seqfile
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python convert_seqs.py DISK_DIR [DISK_DIR ...]")
+        sys.exit(1)
+
+    for disk in sys.argv[1:]:
+        if (Path(disk) / seqfile.FILE_NAME).exists():
+            print(f"{disk}: already converted")
+            continue
+        seqs = seqfile.convert(disk)
+        print(f"{disk}: converted {len(seqs)} sequences")
+
+    sys.exit()
+
+#
@@ -11,8 +11,8 @@
 import sys
 from multiprocessing import freeze_support, set_start_method
 
-from time import perf_counter, sleep, time
-from multiprocessing import Process, Value
+from time import perf_counter, process_time, sleep, time
+from multiprocessing import Process, Value, Array
 
 # -----------------------------------------------------------------------------
 '''We put the multiprocess clock here so that when using set_start_method('spawn'), we
@@ -46,31 +46,114 @@ class ClockGen:
     SOFTWARE.
     '''
     # TODO: Needs more comments/documentation
-    def __init__(self):
+    # Clock modes: 'deadline' sleeps until just before each absolute pulse deadline then spins
+    # the last stretch | 'spin' is the original busy-wait loop (kept for comparison)
+    modes = ('deadline', 'spin')
+    mode = 'deadline'
+
+    SPIN_WINDOW = 0.001 # seconds spun (not slept) before each deadline, grows if sleep() oversleeps
+
+    def __init__(self, mode=None):
         self.shared_bpm = Value('f', 60)
         self._run_code = Value('i', 1)  # used to stop Clock from main process
+
+        # Published by the clock: count of pulses fired and the perf_counter() time of the last one
+        # (both are written under the pulses lock, so read them under it too - see read_pulses)
+        self.pulses = Value('q', 0)
+        self.pulse_time = Value('d', 0.0)
         self.clock_process = None
+        if mode is not None:
+            self.mode = mode
+
+        # Written by the clock process: [cpu %, mean jitter ms, max jitter ms, drift ms, pulses]
+        self.stats = Array('d', 5)
+
+    @staticmethod
+    def _publish(pulses, pulse_time, now):
+        with pulses.get_lock():
+            pulse_time.value = now
+            pulses.value += 1
+
+    def read_pulses(self):
+        '''Returns (pulse count, time of last pulse) as a consistent pair'''
+        with self.pulses.get_lock():
+            return self.pulses.value, self.pulse_time.value
 
     @staticmethod
-    def _clock_generator(out_port, bpm, run):
+    def _clock_generator(pulses, pulse_time, bpm, run, stats):
+        '''Original busy-wait clock: each interval is measured from the previous pulse'''
+        report = ClockReport(stats)
 
         while run.value:
             pulse_rate = 60.0 / (bpm.value * 24) # NUmber of pulses in 60 seconds
-            out_port.send(1)
             t1 = perf_counter()
-            
+            ClockGen._publish(pulses, pulse_time, t1)
+            report.pulse(t1, pulse_rate)
+
             t2 = perf_counter()
             while (t2 - t1) < pulse_rate:
                 t2 = perf_counter()
 
-    def launch_process(self, out_port):
+        report.publish()
+
+    @staticmethod
+    def _deadline_generator(pulses, pulse_time, bpm, run, stats, spin_window):
+        '''Deadline clock: pulse N fires at start + N*period, so timing error never accumulates.
+        Sleeps until spin_window before the deadline, then spins to hit it precisely
+        '''
+        report = ClockReport(stats)
+
+        tempo = bpm.value
+        period = 60.0 / (tempo * 24)
+        start = perf_counter()
+        n = 0
+        window = spin_window
+        oversleep = 0.0 # smoothed estimate of how late sleep() wakes up
+
+        while run.value:
+            deadline = start + n * period
+
+            wake = deadline - window
+            remaining = wake - perf_counter()
+            if remaining > 0:
+                sleep(remaining)
+                # Coarse timers (i.e. Windows) oversleep, so spin for longer before the deadline
+                oversleep = 0.9 * oversleep + 0.1 * max(0.0, perf_counter() - wake)
+                window = min(period / 2, max(spin_window, 2 * oversleep))
+
+            now = perf_counter()
+            while now < deadline:
+                now = perf_counter()
+
+            ClockGen._publish(pulses, pulse_time, now)
+            report.pulse(now, period)
+            n += 1
+
+            if bpm.value != tempo: # Re-anchor on the last deadline so a tempo change doesn't jump
+                tempo = bpm.value
+                period = 60.0 / (tempo * 24)
+                start = deadline
+                n = 1
+
+        report.publish()
+
+    def launch_process(self):
         if self.clock_process:  # if the process exists, close prior to creating a new one
             self.end_process()
 
         self._run_code.value = 1
+        self.pulses.value = 0
+        shared = (self.pulses, self.pulse_time, self.shared_bpm, self._run_code, self.stats)
+        if self.mode == 'spin':
+            target = self._clock_generator
+            args = shared
+        else:
+            target = self._deadline_generator
+            args = shared + (self.SPIN_WINDOW,)
+
         self.clock_process = Process(
-            target = self._clock_generator,
-            args = (out_port, self.shared_bpm, self._run_code),
+            target = target,
+            args = args,
             name='pydm-clock-background'
         )
         self.clock_process.start()
@@ -79,12 +162,69 @@ class ClockGen:
         self._run_code.value = 0
         self.clock_process.join()
         self.clock_process.close()
+        self.clock_process = None
+        print(self.report())
+
+    def report(self):
+        cpu, jitter, max_jitter, drift, pulses = self.stats[:]
+        return (
+            f"clock [{self.mode}]: {int(pulses)} pulses | cpu {cpu:.1f}% | "
+            f"jitter mean {jitter:.3f} ms, max {max_jitter:.3f} ms | drift {drift:.3f} ms"
+        )
+
+
+class ClockReport:
+    '''Collects timing stats inside the clock process and publishes them to a shared Array
+    jitter: error of each pulse interval vs. the ideal period | drift: accumulated error vs. the
+    ideal schedule (the spin clock drifts, the deadline clock should not)
+    '''
+    def __init__(self, stats):
+        self.stats = stats
+        self.cpu_start = process_time()
+        self.wall_start = perf_counter()
+        self.last = None
+        self.ideal = None
+        self.count = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.drift = 0.0
+
+    def pulse(self, now, period):
+        if self.last is not None:
+            jitter = abs((now - self.last) - period)
+            self.jitter_sum += jitter
+            self.jitter_max = max(self.jitter_max, jitter)
+            self.ideal += period
+        else:
+            self.ideal = now
+
+        self.drift = now - self.ideal
+        self.last = now
+        self.count += 1
+
+        if self.count % 24 == 0: # Publish once per beat
+            self.publish()
+
+    def publish(self):
+        wall = perf_counter() - self.wall_start
+        cpu = 100 * (process_time() - self.cpu_start) / wall if wall > 0 else 0.0
+        intervals = max(1, self.count - 1)
+        self.stats[:] = [
+            cpu,
+            1000 * self.jitter_sum / intervals,
+            1000 * self.jitter_max,
+            1000 * self.drift,
+            self.count
+        ]
 
 #  “entry point” protection, see (1) "Safe importing of main module"
 if __name__ == "__main__":
     freeze_support() # Required on Windows to package executable, see (2)
     set_start_method('spawn') # Make behavior of start method the same for all platforms, see (3)
 
+    if '--spin-clock' in sys.argv: # Use the original busy-wait clock (for comparison)
+        ClockGen.mode = 'spin'
+
     from pydm import app
     app.run(ClockGen)
     sys.exit()
@@ -3,19 +3,22 @@
 # -----------------------------------------------------------------------------
 
 from pathlib import Path
+import argparse
 import sys
 import os
 import shutil
 import time
+from time import perf_counter
 
 import pygame
 from pygame.locals import *
 
-from pydm.gui import LCD, Panel
+from pydm.gui import LCD, Panel, FrameStats, STATS_KEY
 from pydm.core import (
     Sequencer,
     SNDEngine,
-    FloppyDisk
+    FloppyDisk,
+    JobQueue
 )
 from pydm.modes import (
     Perform,
@@ -26,17 +29,22 @@ from pydm.modes import (
     Song
 )
 
+FPS = 60 # GUI frames drawn per second (--fps N)
+POLL_RATE = 500 # main loop passes per second: input, jobs and the sequencer are polled on each one
+IDLE_FPS = 4 # frames drawn per second when nothing happened (for changes no event announces)
+
 # ==============================================================================
 class DrumMachine:
     pad_keys = [K_a, K_s, K_d, K_f, K_g, K_h, K_j, K_k]
     chan_keys = [K_1, K_2, K_3, K_4, K_5 , K_6, K_7, K_8]
 
-    def __init__(self, mixer, DIR, ClockGen):
+    def __init__(self, mixer, DIR, ClockGen, soft_mixer=False, load_timing=False):
         self.ROOT_DIR = DIR
 
         # ---- CORE
         self.sequencer = Sequencer(ClockGen)
-        self.snd_engine = SNDEngine(mixer, self.ROOT_DIR)
+        self.snd_engine = SNDEngine(mixer, self.ROOT_DIR, soft_mixer=soft_mixer, load_timing=load_timing)
+        self.jobs = JobQueue() # Slow sound edits run here, off the GUI thread
 
         # ---- GUI
         self.lcd = LCD(DIR)
@@ -53,6 +61,9 @@ class DrumMachine:
         self.sequencer.load_config(self.disk.config)
         self.sequencer.set_seq()
 
+        self.redraw = True # next render draws the whole window (set when the window needs it)
+        self.dirty = True # something happened since the last frame (see frame_due)
+        self.last_drawn = 0.0
         self.mode = Perform(self) # Set mode to Perform
 
     def change_mode(self, next_mode):
@@ -73,14 +84,47 @@ class DrumMachine:
             elif next_mode == 'song':
                 self.mode = Song(self)
 
+    def frame_due(self, now):
+        '''Should the frame be drawn? Not if nothing happened since the last one (input, playback,
+        a background job) unless it is time for an IDLE_FPS frame
+        '''
+        busy = self.dirty or self.redraw or self.sequencer.state.playing or self.mode.job is not None
+        return busy or now - self.last_drawn >= 1 / IDLE_FPS
+
     def render(self, screen):
-        self.panel.render(screen, self.sequencer)
-        # LCD outline "pop" effect
-        pygame.draw.rect(screen, (22, 20, 21), (self.lcd.blitloc[0]-1, 0, self.lcd.WIDTH+1, 233) , 4)
-        screen.blit(self.lcd.DISPLAY, self.lcd.blitloc)
+        '''Draw what changed since the last frame | returns the dirty rects for pygame.display.update'''
+        full, self.redraw = self.redraw, False
+        rects = self.panel.render(screen, self.sequencer, full=full)
+        if full:
+            # LCD outline "pop" effect
+            pygame.draw.rect(screen, (22, 20, 21), (self.lcd.blitloc[0]-1, 0, self.lcd.WIDTH+1, 233) , 4)
+            self.lcd.shown = None
+
+        for rect in self.lcd.changed_rects():
+            rects.append(screen.blit(self.lcd.DISPLAY, rect.move(self.lcd.blitloc), rect))
+        return rects
 
 # ==============================================================================
+def fps_arg(text):
+    try:
+        fps = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fps must be a whole number, not {text!r}")
+    if not 1 <= fps <= POLL_RATE:
+        raise argparse.ArgumentTypeError(f"fps must be 1 to {POLL_RATE}")
+    return fps
+
+def parse_args():
+    '''App options | others (i.e. main.py --spin-clock) are left to their owners'''
+    parser = argparse.ArgumentParser(description="pyDM404 - A cross platform Drum Sequencer")
+    parser.add_argument('--fps', type=fps_arg, default=FPS, help=f"GUI frames per second (default {FPS})")
+    parser.add_argument('--soft-mixer', action='store_true', help="mix sounds in numpy (pydm/core/mixer.py)")
+    parser.add_argument('--load-timing', action='store_true', help="print the load time of every sound")
+    return parser.parse_known_args()[0]
+
 def run(ClockGen):
+    args = parse_args()
+
     # Check if running from bundled binary or source code
     # Set DIR to coorect location i.e. the Top level dir of the program based on location
     if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
@@ -150,27 +194,69 @@ def run(ClockGen):
         print("old temp files found, removing...") # clean up (would exist if app crashed)
         shutil.rmtree(TEMP_DIR / 'default')
 
+    frame_time = 1 / args.fps
+    print(f"GUI at {args.fps} fps, polling at {POLL_RATE} Hz")
+
     '''Init DrumMachine | pygame.mixer must be passed as arg'''
-    dm = DrumMachine(pygame.mixer, DIR, ClockGen)
+    dm = DrumMachine(pygame.mixer, DIR, ClockGen, soft_mixer=args.soft_mixer, load_timing=args.load_timing)
     dm.screen = screen
+    stats = FrameStats(dm.panel.font)
 
-    '''Application Loop: handle input -> update -> render'''
+    '''Application Loop: handle input -> poll sequencer -> (once per frame) update -> render
+    The loop runs at POLL_RATE so the sequencer is polled on time however long a frame takes to draw
+    '''
+    next_frame = perf_counter()
     running = True
     while running:
         for event in pygame.event.get():
+            dm.dirty = True
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type == KEYDOWN and event.key == STATS_KEY:
+                stats.toggle()
+                dm.redraw = True
             else:
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWSIZECHANGED):
+                    dm.redraw = True # window contents lost/rescaled, dirty rects are not enough
                 dm.mode.events(event)
 
-        dm.mode.update()
-        dm.render(screen)
-        pygame.display.flip()
-        clock.tick(160)
+        if dm.jobs.poll(): # swap in finished edits before the frame is drawn
+            dm.dirty = True
+        dm.mode.poll()
+        now = perf_counter()
+        stats.poll(now)
+
+        if now >= next_frame:
+            next_frame = max(next_frame + frame_time, now)
+            if dm.frame_due(now):
+                dm.mode.update()
+                rects = dm.render(screen)
+                if stats.visible:
+                    rects.append(stats.draw(screen))
+                if rects:
+                    pygame.display.update(rects) # only the dirty parts of the window
+                dm.dirty = False
+                dm.last_drawn = now
+                stats.frame(now, perf_counter())
+            else:
+                stats.skip()
+        clock.tick(POLL_RATE)
 
     # Shutdown and clean up | Check if clock is running and shut down/kill process if needed
     if dm.sequencer.clock is not None:
         dm.sequencer.check_clock()
+    dm.jobs.stop()
+    dm.snd_engine.dispatcher.stop()
+    dm.snd_engine.loader.shutdown()
+    if dm.snd_engine.pitch_cache.writer is not None:
+        dm.snd_engine.pitch_cache.writer.close()
+    if dm.snd_engine.soft_mixer is not None:
+        dm.snd_engine.soft_mixer.stop()
+        print(dm.snd_engine.soft_mixer.report())
+    print(dm.snd_engine.dispatcher.report())
+    print(dm.snd_engine.pitch_cache.report())
+    print(dm.lcd.font.cache.report())
+    print(stats.report())
 
     shutil.rmtree(TEMP_DIR / 'default') # remove temp files
     pygame.quit()
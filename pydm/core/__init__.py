@@ -1,3 +1,4 @@
 from pydm.core.sequencer import Sequencer
 from pydm.core.snd_engine import SNDEngine
 from pydm.core.floppydisk import FloppyDisk
+from pydm.core.jobs import JobQueue
@@ -0,0 +1,69 @@
+import heapq
+import threading
+from itertools import count
+from time import perf_counter
+
+
+class Dispatcher:
+    '''Calls scheduled functions at absolute perf_counter() times from a background thread
+    Used to trigger sounds ahead of the main loop, so playback timing does not depend on
+    how long the GUI takes to render a frame
+    '''
+    SPIN = 0.001 # seconds spun (not waited) before each target time
+
+    def __init__(self):
+        self.queue = [] # heap of (time, order, func, args)
+        self.order = count() # tie breaker, keeps events with the same time in schedule order
+        self.cond = threading.Condition()
+        self.running = True
+        self.max_late = 0.0 # worst dispatch lateness seen (seconds)
+
+        self.thread = threading.Thread(target=self._run, name='pydm-dispatcher', daemon=True)
+        self.thread.start()
+
+    def schedule(self, when, func, *args):
+        with self.cond:
+            heapq.heappush(self.queue, (when, next(self.order), func, args))
+            self.cond.notify()
+        return
+
+    def clear(self):
+        with self.cond:
+            self.queue.clear()
+        return
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+        return
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running:
+                    if len(self.queue) == 0:
+                        self.cond.wait()
+                        continue
+
+                    wait = self.queue[0][0] - perf_counter() - self.SPIN
+                    if wait <= 0:
+                        break
+                    self.cond.wait(wait)
+
+                if self.running is False:
+                    return
+
+                when, _, func, args = heapq.heappop(self.queue)
+
+            while perf_counter() < when:
+                pass
+
+            self.max_late = max(self.max_late, perf_counter() - when)
+            func(*args)
+
+    def report(self):
+        return f"dispatcher: max late {1000*self.max_late:.3f} ms"
+
+# EOF
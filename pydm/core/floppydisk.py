@@ -2,7 +2,7 @@ from pathlib import Path
 import shutil
 import json
 
-import numpy as np
+from pydm.core import seqfile
 
 # ============================================================================
 class FloppyDisk:
@@ -40,11 +40,22 @@ class FloppyDisk:
         return
 
     def load_seqs(self):
-        '''Need allow_pickle since array of arrays, which are "objects"'''
-        seq_path = self.path / 'sequences.npy'
-        return np.load(seq_path, allow_pickle=True)
+        '''Load all sequences as an array of arrays | Disks saved before sequences.seq
+        existed are read from sequences.npy (without unpickling anything but arrays)
+        '''
+        seq_path = self.path / seqfile.FILE_NAME
+        if seq_path.exists():
+            return seqfile.read_seqs(seq_path)
+        return seqfile.read_legacy(self.path / seqfile.LEGACY_NAME)
+
+    def load_seq(self, idx):
+        '''Load a single sequence without reading the rest of the file'''
+        seq_path = self.path / seqfile.FILE_NAME
+        if seq_path.exists():
+            return seqfile.read_seq(seq_path, idx)
+        return self.load_seqs()[idx]
 
     def save_seq(self, seqs):
-        '''Save sequnces in an array of arrays'''
-        np.save(self.path / 'sequences.npy', seqs)
+        '''Save sequnces in the sequences.seq format'''
+        seqfile.write_seqs(self.path / seqfile.FILE_NAME, seqs)
         return
@@ -0,0 +1,126 @@
+'''Undo/redo for the sound editor
+Edits are made in place on one buffer and each one records only what it needs to be swapped back:
+a truncate the old window (offsets into the buffer, the cut off ends are still in it), a reverse
+nothing at all (reversing again undoes it), a replace (filter) the old contents of the window.
+Swapping an entry back also makes it the redo entry, so redo costs no more memory than undo.
+The entries are kept to a memory budget, the oldest are forgotten first
+'''
+UNDO_BUDGET = 64 * 2**20 # bytes of undo/redo data kept per edit session
+
+
+class Truncate:
+    '''Window before the edit (start/end offsets into EditHistory.data)'''
+    nbytes = 0
+
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    def swap(self, history):
+        history.lo, self.lo = self.lo, history.lo
+        history.hi, self.hi = self.hi, history.hi
+        return
+
+
+class Reverse:
+    '''Only a flag: the edit is its own inverse'''
+    nbytes = 0
+
+    def swap(self, history):
+        history.reverse_window()
+        return
+
+
+class Replace:
+    '''Contents of the window before the edit (the window keeps its size)'''
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def swap(self, history):
+        window = history.sound
+        old = window.copy()
+        window[...] = self.data
+        self.data = old
+        return
+
+# ============================================================================
+class EditHistory:
+    '''An edited sound and its undo/redo stacks | sound is a view into data, never copied for an edit'''
+    def __init__(self, data, budget=UNDO_BUDGET):
+        self.data = data
+        self.lo = 0
+        self.hi = data.shape[0]
+        self.budget = budget
+        self.undos = []
+        self.redos = [] # last is the next redo
+
+    @property
+    def sound(self):
+        return self.data[self.lo:self.hi]
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self.undos + self.redos)
+
+    def reverse_window(self):
+        window = self.sound
+        window[...] = window[::-1] # numpy buffers overlapping copies
+        return
+
+    # --------------------------------------------------------------------------
+    def truncate(self, start, end):
+        '''Keep frames start:end of the sound'''
+        self.push(Truncate(self.lo, self.hi))
+        self.lo, self.hi = self.lo + start, self.lo + end
+        return
+
+    def reverse(self):
+        self.reverse_window()
+        self.push(Reverse())
+        return
+
+    def replace(self, data):
+        '''Replace the sound with data of the same shape (e.g. filtered)'''
+        window = self.sound
+        entry = Replace(window.copy())
+        window[...] = data
+        self.push(entry)
+        return
+
+    def push(self, entry):
+        self.undos.append(entry)
+        self.redos.clear() # a new edit ends the redo history
+        self.trim()
+        return
+
+    def trim(self):
+        '''Forget the oldest entries until the stacks fit the budget'''
+        nbytes = self.nbytes
+        while nbytes > self.budget and (self.undos or self.redos):
+            entry = self.undos.pop(0) if self.undos else self.redos.pop(0)
+            nbytes -= entry.nbytes
+        return
+
+    # --------------------------------------------------------------------------
+    def undo(self):
+        '''Returns False if there is nothing to undo'''
+        if not self.undos:
+            return False
+        entry = self.undos.pop()
+        entry.swap(self)
+        self.redos.append(entry)
+        return True
+
+    def redo(self):
+        if not self.redos:
+            return False
+        entry = self.redos.pop()
+        entry.swap(self)
+        self.undos.append(entry)
+        return True
+
+# EOF
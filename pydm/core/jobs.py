@@ -0,0 +1,112 @@
+'''Background jobs: slow edits run on a worker thread so the GUI (and the sequencer) keep going
+A job's work is a generator: it yields its progress (0-1) now and then and returns its result.
+Between yields the job can be cancelled. Results are handed back on the main thread by poll(),
+once per frame, so the on_done callback swaps them in between two frames (never half way through one).
+Jobs run one at a time, in the order they were submitted
+'''
+from collections import deque
+import threading
+import traceback
+
+
+def call(func, *args):
+    '''Work for a quick function call (no progress to report, can only be cancelled before it starts)'''
+    yield 0.0
+    return func(*args)
+
+
+class Job:
+    def __init__(self, name, work, on_done=None):
+        self.name = name
+        self.work = work
+        self.on_done = on_done # called with the result, on the main thread (see JobQueue.poll)
+        self.state = 'queued' # -> running -> done / cancelled / failed
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.delivered = False # poll is done with it (on_done has run) | set on the main thread
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    def cancel(self):
+        self.cancelled.set()
+        return
+
+    def run(self):
+        '''Step the work until it returns or the job is cancelled (on the worker thread)'''
+        self.state = 'running'
+        try:
+            while True:
+                if self.cancelled.is_set():
+                    self.work.close() # runs the generator's cleanup (finally/GeneratorExit)
+                    self.state = 'cancelled'
+                    return
+                self.progress = min(1.0, float(next(self.work)))
+        except StopIteration as done:
+            self.result = done.value
+            self.progress = 1.0
+            self.state = 'done'
+        except Exception as e:
+            traceback.print_exc()
+            self.error = e
+            self.state = 'failed'
+        return
+
+
+class JobQueue:
+    def __init__(self):
+        self.queue = deque()
+        self.finished = deque() # jobs the worker is done with, for poll()
+        self.current = None
+        self.wake = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='pydm-jobs', daemon=True)
+        self.thread.start()
+
+    def submit(self, name, work, on_done=None):
+        '''Queue work (a generator, see call) | returns the Job, to show its progress or cancel it'''
+        job = Job(name, work, on_done)
+        self.queue.append(job)
+        self.wake.set()
+        return job
+
+    def _run(self):
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+            while self.queue and self.running:
+                job = self.current = self.queue.popleft()
+                job.run()
+                self.current = None
+                self.finished.append(job)
+        return
+
+    def poll(self):
+        '''Call once per frame: runs on_done for the jobs finished since the last call
+        Returns the number of jobs handled
+        '''
+        delivered = 0
+        while self.finished:
+            job = self.finished.popleft()
+            if job.state == 'done' and job.on_done is not None:
+                job.on_done(job.result)
+            elif job.state == 'failed':
+                print(f"Job {job.name} failed: {job.error}")
+            job.delivered = True
+            delivered += 1
+        return delivered
+
+    def stop(self):
+        '''Cancel everything and wait for the worker (a running job stops at its next yield)'''
+        self.running = False
+        for job in [self.current, *self.queue]:
+            if job is not None:
+                job.cancel()
+        self.wake.set()
+        self.thread.join(timeout=2)
+        return
+
+# EOF
@@ -0,0 +1,296 @@
+'''Software mixer: an alternative to playing sounds on the fixed pygame.mixer channels
+Voices are mixed into fixed size float32 blocks (all buffers are made up front) and the blocks are
+handed to a sink: the pygame mixer, a WAV file, or nothing (for benchmarks).
+Choke groups work like the pygame channels (a new sound cuts the one playing in its group), but the
+cut sound is faded out instead of stopped dead, and voices are only stolen when all are in use.
+'''
+from collections import deque
+from time import perf_counter, sleep
+import threading
+import wave
+
+import numpy as np
+import pygame
+
+RATE = 44100
+BLOCK = 512 # frames per block (11.6 ms at 44.1 kHz)
+VOICES = 32
+FADE = 64 # frames a cut voice takes to fade out (1.5 ms, enough to avoid a click)
+
+
+class Voice:
+    '''A sound being played | data is int16 or float32 (frames, 2), pos is the next frame to mix'''
+    __slots__ = ('data', 'pos', 'gain', 'choke', 'delay', 'order')
+
+    def __init__(self, data, gain, choke, delay, order):
+        self.data = data
+        self.pos = 0
+        self.gain = gain
+        self.choke = choke
+        self.delay = delay # frames into the next block before the voice starts
+        self.order = order
+
+
+class SoftMixer:
+    def __init__(self, sink, block=BLOCK, voices=VOICES, fade=FADE, rate=RATE):
+        self.sink = sink
+        self.block = block
+        self.rate = rate
+        self.fade = fade
+
+        self.voices = [None] * voices
+        self.pending = deque() # (when, data, gain, choke) from play(), picked up by the next block
+        self.pending_lock = threading.Lock() # play/cancel come from other threads than take_pending
+        self.order = 0
+
+        self.out = np.zeros((block, 2), dtype=np.float32)
+        self.scratch = np.zeros((block + fade, 2), dtype=np.float32)
+        self.pcm = np.zeros((block, 2), dtype=np.int16)
+        # Fade outs of cut voices, mixed into the next block(s)
+        self.carry = np.zeros((block + fade, 2), dtype=np.float32)
+        self.carry_len = 0
+        self.ramp = np.linspace(1, 0, fade, endpoint=False, dtype=np.float32)[:, None]
+
+        self.block_time = None # perf_counter() time the next block starts playing
+        self.thread = None
+        self.running = False
+
+        # Stats
+        self.blocks = 0
+        self.steals = 0
+        self.max_voices = 0
+        self.cpu_sum = 0.0
+        self.cpu_max = 0.0
+
+    # --------------------------------------------------------------------------
+    def play(self, data, gain=1.0, choke=None, when=None):
+        '''Start data (int16/float32 (frames, 2)) at gain | choke: group that cuts the voice playing in it
+        when: perf_counter() time to start, else as soon as possible (safe to call from any thread)
+        '''
+        with self.pending_lock:
+            self.pending.append((when, data, gain, choke))
+        return
+
+    def cancel(self):
+        '''Drop the voices handed to play that have not started yet'''
+        with self.pending_lock:
+            self.pending.clear()
+        return
+
+    def start_voice(self, data, gain, choke, delay):
+        if choke is not None:
+            for i, voice in enumerate(self.voices):
+                if voice is not None and voice.choke == choke:
+                    self.release(i, delay)
+
+        slot = next((i for i, voice in enumerate(self.voices) if voice is None), None)
+        if slot is None: # all in use: steal the oldest voice
+            slot = min(range(len(self.voices)), key=lambda i: self.voices[i].order)
+            self.release(slot, delay)
+            self.steals += 1
+
+        self.voices[slot] = Voice(data, gain, choke, delay, self.order)
+        self.order += 1
+        return
+
+    def release(self, slot, delay):
+        '''Free a slot | the voice plays on until delay, then fades out (mixed through carry)'''
+        voice = self.voices[slot]
+        self.voices[slot] = None
+
+        start = voice.delay # a voice that hasn't started yet starts in the carry too
+        frames = min(delay - start + self.fade, voice.data.shape[0] - voice.pos)
+        if frames <= 0:
+            return
+
+        tail = self.scratch[:frames]
+        np.multiply(voice.data[voice.pos:voice.pos + frames], voice.gain, out=tail)
+        fade_from = max(0, delay - start)
+        fading = tail[fade_from:]
+        fading *= self.ramp[:fading.shape[0]]
+
+        self.carry[start:start + frames] += tail
+        self.carry_len = max(self.carry_len, start + frames)
+        return
+
+    # --------------------------------------------------------------------------
+    def take_pending(self, now):
+        '''Start the voices due in the coming block, at their frame offset in it'''
+        block_end = now + self.block / self.rate
+        due = []
+        with self.pending_lock: # a cancel can't slip in between taking and putting back
+            keep = deque()
+            for item in self.pending:
+                if item[0] is not None and item[0] >= block_end:
+                    keep.append(item)
+                else:
+                    due.append(item)
+            self.pending = keep
+        for when, data, gain, choke in due:
+            delay = 0 if when is None else int(max(0.0, when - now) * self.rate)
+            self.start_voice(data, gain, choke, min(delay, self.block - 1))
+        return
+
+    def mix(self):
+        '''Mix the next block | returns the int16 (block, 2) buffer (reused, copy it to keep it)'''
+        start = perf_counter()
+        now = self.block_time if self.block_time is not None else start
+        self.take_pending(now)
+
+        out = self.out
+        out.fill(0)
+        block = self.block
+
+        if self.carry_len:
+            n = min(self.carry_len, block)
+            out[:n] += self.carry[:n]
+            left = self.carry_len - n
+            self.carry[:left] = self.carry[n:self.carry_len]
+            self.carry[left:self.carry_len] = 0
+            self.carry_len = left
+
+        active = 0
+        for i, voice in enumerate(self.voices):
+            if voice is None:
+                continue
+            active += 1
+            n = min(block - voice.delay, voice.data.shape[0] - voice.pos)
+            part = self.scratch[:n]
+            np.multiply(voice.data[voice.pos:voice.pos + n], voice.gain, out=part)
+            out[voice.delay:voice.delay + n] += part
+
+            voice.pos += n
+            voice.delay = 0
+            if voice.pos >= voice.data.shape[0]:
+                self.voices[i] = None
+
+        np.clip(out, -32768, 32767, out=out)
+        np.rint(out, out=out)
+        self.pcm[...] = out
+
+        cpu = perf_counter() - start
+        self.blocks += 1
+        self.cpu_sum += cpu
+        self.cpu_max = max(self.cpu_max, cpu)
+        self.max_voices = max(self.max_voices, active)
+        return self.pcm
+
+    # --------------------------------------------------------------------------
+    def start(self):
+        '''Mix in a background thread, as fast as the sink takes blocks'''
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='pydm-softmixer', daemon=True)
+        self.thread.start()
+        return
+
+    def _run(self):
+        self.block_time = perf_counter() # the first block is heard at once, the rest back to back
+        while self.running:
+            self.sink.write(self.mix())
+            # Blocks play back to back: keep the block clock unless the sink fell behind
+            self.block_time = max(self.block_time + self.block / self.rate, perf_counter())
+        return
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+        self.sink.close()
+        return
+
+    def report(self):
+        blocks = max(1, self.blocks)
+        budget = 1000 * self.block / self.rate
+        return (
+            f"soft mixer: {self.blocks} blocks of {self.block} frames | cpu/block "
+            f"{1000*self.cpu_sum/blocks:.3f} ms mean, {1000*self.cpu_max:.3f} ms max "
+            f"(of {budget:.1f} ms) | voices max {self.max_voices}/{len(self.voices)}, "
+            f"steals {self.steals} | {self.sink.report()}"
+        )
+
+# ============================================================================
+# -- Sinks | write(pcm) takes a block (blocking until there is room for it)
+class NullSink:
+    '''Throws blocks away (benchmarks)'''
+    def write(self, pcm):
+        return
+
+    def close(self):
+        return
+
+    def report(self):
+        return "null sink"
+
+
+class WavSink:
+    '''Writes blocks to a WAV file, as fast as they are mixed'''
+    def __init__(self, path, rate=RATE):
+        self.file = wave.open(str(path), 'wb')
+        self.file.setnchannels(2)
+        self.file.setsampwidth(2)
+        self.file.setframerate(rate)
+        self.frames = 0
+
+    def write(self, pcm):
+        self.file.writeframes(pcm.astype('<h', copy=False).tobytes())
+        self.frames += pcm.shape[0]
+        return
+
+    def close(self):
+        self.file.close()
+        return
+
+    def report(self):
+        return f"wav sink: {self.frames} frames"
+
+
+class PygameSink:
+    '''Streams blocks through one pygame.mixer channel, keeping one block queued behind the playing one
+    (so the mixer works about one block ahead of what is heard)
+    The blocks go through a ring of RING Sounds made up front, written in place (sndarray.samples):
+    once the queue is free the Sound two blocks back has finished playing and can be reused
+    '''
+    RING = 3
+
+    def __init__(self, mixer, block=BLOCK, lock=None):
+        # Add a channel of our own, the others keep working for previews/error beeps
+        self.channel_num = mixer.get_num_channels()
+        mixer.set_num_channels(self.channel_num + 1)
+        self.channel = mixer.Channel(self.channel_num)
+        self.mixer = mixer
+        self.lock = lock or threading.Lock() # shared with the other users of the mixer (SNDEngine.mixer_lock)
+        self.underruns = 0
+
+        self.sounds = [mixer.Sound(buffer=bytes(block * 2 * 2)) for _ in range(self.RING)] # int16 stereo
+        self.buffers = [pygame.sndarray.samples(sound) for sound in self.sounds]
+        self.next = 0
+
+    def write(self, pcm):
+        while True:
+            with self.lock:
+                if self.channel.get_queue() is None:
+                    break
+            sleep(0.001)
+
+        sound = self.sounds[self.next]
+        self.buffers[self.next][...] = pcm
+        self.next = (self.next + 1) % self.RING
+
+        with self.lock:
+            if self.channel.get_busy():
+                self.channel.queue(sound)
+            else:
+                self.underruns += 1 # the queue ran dry (started, or the mixer thread fell behind)
+                self.channel.play(sound)
+        return
+
+    def close(self):
+        with self.lock:
+            self.channel.stop()
+        return
+
+    def report(self):
+        return f"pygame sink: {self.underruns} underruns"
+
+# EOF
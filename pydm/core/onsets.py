@@ -0,0 +1,74 @@
+'''Onset (transient) detection for auto chopping
+The sound is cut into HOP frame windows and their energy compared in dB: a window much louder than
+the ones just before it starts a hit. Everything is done on whole arrays, a few minutes of audio take
+a fraction of a second. Hits are placed where the attack starts, then moved back to the zero crossing
+just before it, so slices start without a click
+'''
+import numpy as np
+
+RATE = 44100
+HOP = 256 # frames per energy window (5.8 ms)
+LOOKBACK = 4 # windows a hit is compared with
+MIN_GAP = 0.06 # seconds between two hits
+SENSITIVITY = range(1, 11) # 10 finds the most hits
+
+
+def threshold(sensitivity):
+    '''dB rise over the recent level that counts as a hit'''
+    return 10.5 - sensitivity
+
+
+def energy_db(samples):
+    '''Energy (dB) of each HOP window of samples (frames, channels) or (frames,)'''
+    mono = samples.mean(axis=1, dtype=np.float32) if samples.ndim == 2 else samples.astype(np.float32)
+    windows = mono.shape[0] // HOP
+    power = np.square(mono[:windows * HOP].reshape(windows, HOP)).mean(axis=1)
+    return 10 * np.log10(power + 1.0), mono
+
+
+def find_onsets(samples, sensitivity=5, limit=None, rate=RATE):
+    '''Frame positions of the hits in samples, in order | limit: keep only the strongest limit hits'''
+    db, mono = energy_db(samples)
+    if db.shape[0] <= LOOKBACK:
+        return []
+
+    # level of a window (or the next one, attacks can straddle two) over the mean of the ones before
+    ahead = np.maximum(db, np.append(db[1:], db[-1]))[LOOKBACK:]
+    total = np.cumsum(np.append(0.0, db))
+    before = (total[LOOKBACK:-1] - total[:-LOOKBACK-1]) / LOOKBACK
+    rise = ahead - before
+    silence = db.max() - 60 # ignore hits in noise far below the loudest part
+    score = np.where((rise > threshold(sensitivity)) & (ahead > silence), rise, -np.inf)
+
+    # one hit per MIN_GAP: keep the windows that rise the most within gap windows either side
+    gap = max(1, int(MIN_GAP * rate / HOP))
+    padded = np.pad(score, gap, constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2*gap + 1).max(axis=1)
+    hits = np.flatnonzero(np.isfinite(score) & (score == local_max))
+    hits = hits[np.diff(hits, prepend=-gap) >= gap] # equal rises close together: the first
+
+    if limit is not None and hits.shape[0] > limit:
+        hits = np.sort(hits[np.argsort(-score[hits], kind='stable')[:limit]])
+
+    hits += LOOKBACK # score[i] is window i+LOOKBACK
+    points = sorted(snap(mono, attack(mono, hit)) for hit in hits.tolist())
+    return [point for point in points if point > 0]
+
+
+def attack(mono, hit):
+    '''First frame of the hit around window hit: where it gets to a quarter of its peak'''
+    start = max(0, (hit - 1) * HOP)
+    level = np.abs(mono[start:(hit + 2) * HOP])
+    return start + int(np.argmax(level >= 0.25 * level.max()))
+
+
+def snap(mono, pos, reach=HOP):
+    '''Zero crossing at or before pos (within reach frames), else pos'''
+    start = max(0, pos - reach)
+    window = mono[start:pos + 1]
+    crossings = np.flatnonzero(np.signbit(window[:-1]) != np.signbit(window[1:]))
+    if crossings.shape[0] == 0:
+        return pos
+    return start + int(crossings[-1]) + 1
+
+# EOF
@@ -0,0 +1,64 @@
+'''Waveform peaks: min/max of a sound at several resolutions, for drawing it in O(pixels)
+Level 0 holds the min and max of every BASE frames, each level above combines FACTOR bins of the one
+below. To draw a region the coarsest level that still has a bin or more per pixel is used, so a
+whole sound and a few milliseconds of it (zoomed in) cost about the same
+'''
+import numpy as np
+
+BASE = 16 # frames per bin of level 0 (below that the samples themselves are used)
+FACTOR = 4 # bins of a level combined into one bin of the next
+
+
+class PeakPyramid:
+    def __init__(self, samples):
+        '''samples: (frames, channels) or (frames,) | peaks are of the first channel (left)'''
+        y = samples[:, 0] if samples.ndim == 2 else samples
+        self.samples = np.array(y, copy=True, order='C') # own copy: edits to the sound happen in place
+        self.length = self.samples.shape[0]
+        self.peak = int(np.abs(self.samples, dtype=np.int32).max()) if self.length else 0
+
+        self.levels = [] # [(bin size in frames, mins, maxs), ...] finest first
+        size, mins, maxs = 1, self.samples, self.samples
+        while mins.shape[0] > FACTOR:
+            step = BASE if size == 1 else FACTOR
+            idx = np.arange(0, mins.shape[0], step)
+            mins, maxs = np.minimum.reduceat(mins, idx), np.maximum.reduceat(maxs, idx)
+            size *= step
+            self.levels.append((size, mins, maxs))
+
+    @property
+    def nbytes(self):
+        return sum(mins.nbytes + maxs.nbytes for _, mins, maxs in self.levels)
+
+    def columns(self, start, end, width):
+        '''(mins, maxs) of frames start:end drawn width pixels wide, one pair per pixel
+        Neighbouring columns overlap by a sample, so drawing them as vertical lines gives a joined up
+        line even when zoomed in to less than a frame per pixel
+        '''
+        start, end = max(0, start), min(self.length, end)
+        if end <= start or width <= 0:
+            empty = np.zeros(0, dtype=self.samples.dtype)
+            return empty, empty
+
+        per_pixel = (end - start) / width
+        size, mins, maxs = 1, self.samples, self.samples
+        for level in self.levels:
+            if level[0] > per_pixel:
+                break
+            size, mins, maxs = level
+
+        edges = start + np.arange(width + 1) * per_pixel
+        first = int(edges[0] // size)
+        last = min(mins.shape[0], max(first + 1, int(np.ceil(edges[-1] / size))))
+        idx = np.minimum((edges[:-1] // size).astype(np.intp), last - 1) - first
+
+        # reduceat takes idx[i]:idx[i+1] (or just idx[i] where that range is empty)
+        col_mins = np.minimum.reduceat(mins[first:last], idx)
+        col_maxs = np.maximum.reduceat(maxs[first:last], idx)
+
+        prev_mins, prev_maxs = col_mins[:-1].copy(), col_maxs[:-1].copy()
+        col_mins[1:] = np.minimum(col_mins[1:], prev_maxs)
+        col_maxs[1:] = np.maximum(col_maxs[1:], prev_mins)
+        return col_mins, col_maxs
+
+# EOF
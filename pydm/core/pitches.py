@@ -0,0 +1,312 @@
+from collections import OrderedDict, deque
+from pathlib import Path
+import hashlib
+import os
+import threading
+
+import pygame.sndarray
+import numpy as np
+
+# Pitched variants kept in memory (bytes) before the least recently used are dropped
+PITCH_BUDGET = 256 * 2**20
+# Pitched variants kept on disk (bytes) by a PitchStore, oldest used are deleted first
+STORE_BUDGET = 1024 * 2**20
+ORIGINAL = 12 # pitch index of the unpitched sound (0-11 lower, 13-24 higher)
+
+
+class Resampler:
+    '''Pitch algorithm - based on the SP1200 algorithm, shifts a sound by pitch-12 semitones
+    Every pitch reads the input at a fixed rate 2**(semitones/12), so all 25 index maps are scaled
+    copies of one shared base ramp. The ramp and the work buffers are kept and reused between calls
+    mode 'nearest': SP1200 style, takes the sample at floor(position)
+    mode 'linear': interpolates between the two nearest samples (smoother, less aliasing)
+    '''
+    modes = ('nearest', 'linear')
+    VERSION = 1 # bump when the output changes, stored pitches made by older versions are then ignored
+
+    def __init__(self, mode='nearest'):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown pitch mode: {mode}")
+        self.mode = mode
+        self.ramp = np.arange(0, dtype=np.float64)
+        self.pos = np.empty(0, dtype=np.float64)
+        self.idx = np.empty(0, dtype=np.intp)
+
+    def reserve(self, size):
+        '''Grow (never shrink) the shared ramp and buffers to hold size positions'''
+        if self.ramp.shape[0] < size:
+            self.ramp = np.arange(size, dtype=np.float64)
+            self.pos = np.empty(size, dtype=np.float64)
+            self.idx = np.empty(size, dtype=np.intp)
+        return
+
+    @staticmethod
+    def rate(length, pitch):
+        '''Returns (read rate, number of output positions before the end test)'''
+        n = abs(pitch - ORIGINAL)
+        if pitch < ORIGINAL: # lower pitch: -1 thru -12 semitones, output is longer
+            return 2**(-n/12), int(np.ceil(length * 2**(n/12)))
+        return 2**(n/12), length # higher pitch: +1 thru +12 semitones
+
+    def pitch(self, data, pitch):
+        length = data.shape[0]
+        if pitch == ORIGINAL or length == 0:
+            return data
+
+        rate, size = self.rate(length, pitch)
+        self.reserve(size)
+
+        pos = np.multiply(self.ramp[:size], rate, out=self.pos[:size])
+        size = np.searchsorted(pos, length) # positions are sorted, drop those past the end
+        pos = pos[:size]
+
+        idx = self.idx[:size]
+        np.floor(pos, out=pos)
+        idx[:] = pos
+
+        if self.mode == 'nearest':
+            return np.take(data, idx, axis=0) # take is much faster than data[idx] for 2d data
+
+        # linear: pos still holds floor(position), rebuild the fractional part from the ramp
+        frac = np.multiply(self.ramp[:size], rate) - pos
+        nxt = np.minimum(idx + 1, length - 1)
+        low = np.take(data, idx, axis=0).astype(np.float32)
+        high = np.take(data, nxt, axis=0)
+        weight = frac.astype(np.float32)
+        if data.ndim == 2: # (frames, channels), mono mixer sndarrays are (frames,)
+            weight = weight[:, None]
+        out = low + (high - low) * weight
+        return np.round(out, out=out).astype(data.dtype)
+
+    def pitch_all(self, data):
+        '''All 25 pitches of data, lowest first (index 12 is data itself)'''
+        rate, size = self.rate(data.shape[0], 0)
+        self.reserve(size) # the longest map, every other pitch reuses the same buffers
+        return [self.pitch(data, pitch) for pitch in range(2*ORIGINAL + 1)]
+
+# ============================================================================
+class PitchTable:
+    '''The 25 pitches of one sound, indexed like a list (table[pitch])
+    The original (pitch 12) is always loaded, the rest are made on first use and held by a PitchCache
+    '''
+    def __init__(self, data, sound, cache, key=None):
+        self.data = data
+        self.original = sound
+        self.cache = cache
+        self._key = key
+
+    def __getitem__(self, pitch):
+        if pitch == ORIGINAL:
+            return self.original
+        return self.cache.get(self, pitch)
+
+    @property
+    def key(self):
+        '''Content hash used by the PitchStore (made on first use)'''
+        if self._key is None:
+            self._key = PitchStore.make_key(self.data, self.cache.resampler.mode)
+        return self._key
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+class PitchCache:
+    '''LRU cache of pitched Sounds shared by all PitchTables, bounded by budget (bytes)'''
+    def __init__(self, budget=PITCH_BUDGET, mode='nearest', store=None):
+        self.budget = budget
+        self.resampler = Resampler(mode)
+        self.store = store # optional PitchStore, written to (behind the writer) for the next disk load
+        self.writer = StoreWriter(store) if store is not None else None
+        self.sounds = OrderedDict() # (table, pitch): (Sound, nbytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, table, pitch):
+        '''Sound of table at pitch | a miss can happen during playback, so it only resamples in memory:
+        the store is read by disk loads (SampleLoader), hashing and saving is left to the writer thread
+        '''
+        key = (table, pitch)
+        entry = self.sounds.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.sounds.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+        data = self.resampler.pitch(table.data, pitch)
+        if self.writer is not None:
+            self.writer.save(table, pitch, data)
+
+        sound = pygame.sndarray.make_sound(data)
+        self.add(key, sound, data.nbytes)
+        return sound
+
+    def add(self, key, sound, nbytes):
+        self.sounds[key] = (sound, nbytes)
+        self.nbytes += nbytes
+        self.evict()
+        return
+
+    def evict(self):
+        # Never evict the newest entry, it is about to be played
+        while self.nbytes > self.budget and len(self.sounds) > 1:
+            _, (sound, nbytes) = self.sounds.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+        return
+
+    def drop(self, table):
+        '''Remove all pitches of a table (sound unloaded or replaced)'''
+        for key in [key for key in self.sounds if key[0] is table]:
+            sound, nbytes = self.sounds.pop(key)
+            self.nbytes -= nbytes
+        return
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.0
+        report = (
+            f"pitch cache: {len(self.sounds)} sounds, {self.nbytes / 2**20:.1f} of "
+            f"{self.budget / 2**20:.0f} MB | hits {self.hits}, misses {self.misses} "
+            f"({rate:.1f}% hit rate), evictions {self.evictions}"
+        )
+        if self.store is not None:
+            report += "\n" + self.store.report()
+        return report
+
+
+class StoreWriter:
+    '''Saves pitches to a PitchStore on a thread of its own (hash, np.save, trim), off the playback path'''
+    def __init__(self, store):
+        self.store = store
+        self.queue = deque() # (table, pitch, data)
+        self.wake = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='pydm-pitch-store', daemon=True)
+        self.thread.start()
+
+    def save(self, table, pitch, data):
+        self.queue.append((table, pitch, data))
+        self.wake.set()
+        return
+
+    def _run(self):
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+            self.flush()
+        return
+
+    def flush(self):
+        while self.queue:
+            table, pitch, data = self.queue.popleft()
+            key = table.key # hashing the sample is the slow part of a save
+            if not self.store.file(key, pitch).exists():
+                self.store.save(key, pitch, data)
+        return
+
+    def close(self):
+        '''Stop the thread, the saves still queued are done first'''
+        self.running = False
+        self.wake.set()
+        self.thread.join(timeout=5)
+        return
+
+
+class PitchStore:
+    '''Pitched sounds saved as .npy files, so a sample that hasn't changed is never resampled twice
+    Files are named by a hash of the sample data, the pitch algorithm version and mode, and the pitch.
+    Edited or chopped samples hash differently, so old entries are never used for them
+    (they are just deleted once they are the oldest and the store is over budget)
+    '''
+    def __init__(self, path, budget=STORE_BUDGET):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.trim()
+
+    @staticmethod
+    def make_key(data, mode):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{Resampler.VERSION}:{mode}:{data.dtype.str}:{data.shape}".encode())
+        h.update(np.ascontiguousarray(data).data)
+        return h.hexdigest()
+
+    def file(self, key, pitch):
+        return self.path / f"{key}-{pitch:02d}.npy"
+
+    def load(self, key, pitch):
+        '''Memory map a stored pitch | returns None if there isn't one'''
+        path = self.file(key, pitch)
+        try:
+            data = np.load(path, mmap_mode='r')
+            os.utime(path) # mtime is the last use, trim deletes the oldest first
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError): # unreadable/partial file, make it again
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data
+
+    def save(self, key, pitch, data):
+        path = self.file(key, pitch)
+        tmp_path = path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, data)
+            tmp_path.replace(path) # other readers never see a half written file
+        except OSError as e:
+            print(f"Pitch store: could not save {path.name} ({e})")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        self.writes += 1
+        self.nbytes += path.stat().st_size
+        if self.nbytes > self.budget:
+            self.trim()
+        return
+
+    def trim(self):
+        '''Recount the store (other processes may have written to it) and delete the oldest used
+        files until it fits the budget again
+        '''
+        files = []
+        for path in self.path.glob('*.npy'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        self.nbytes = sum(size for _, size, _ in files)
+        if self.nbytes <= self.budget:
+            return
+
+        for _, size, path in sorted(files):
+            path.unlink(missing_ok=True)
+            self.nbytes -= size
+            self.evictions += 1
+            if self.nbytes <= 0.9 * self.budget: # leave some room, don't trim on every save
+                break
+        return
+
+    def report(self):
+        return (
+            f"pitch store: {self.nbytes / 2**20:.1f} of {self.budget / 2**20:.0f} MB on disk | "
+            f"hits {self.hits}, misses {self.misses}, writes {self.writes}, evictions {self.evictions}"
+        )
+
+# EOF
@@ -0,0 +1,143 @@
+'''Offline rendering: mix a sequence or a song of a disk to audio, much faster than realtime
+Needs no display or audio device. Timing, swing, choke (one sound at a time per Pad.channel) and
+pad/master volume follow what the live engine does with pygame.mixer (see SNDEngine.play_sound)
+'''
+from pathlib import Path
+import json
+
+import numpy as np
+
+from pydm.core import seqfile
+from pydm.core.sequencer import Sequencer
+from pydm.core.pitches import Resampler
+from pydm.core.loader import decode_wav
+from pydm.core.snd_engine import bank_map, ekey_map
+
+RATE = 44100
+CHANNELS = 2
+
+
+def read_disk(disk_dir):
+    '''(config, sequences) of the disk at disk_dir (same files FloppyDisk loads)'''
+    disk_dir = Path(disk_dir)
+    with open(disk_dir / 'config.json', 'r') as f:
+        config = json.load(f)
+
+    seq_path = disk_dir / seqfile.FILE_NAME
+    if seq_path.exists():
+        seqs = seqfile.read_seqs(seq_path)
+    else:
+        seqs = seqfile.read_legacy(disk_dir / seqfile.LEGACY_NAME)
+    return config, seqs
+
+# ============================================================================
+class Renderer:
+    '''Mixes sequences using the pads of a disk config | pitched sounds are made once and reused'''
+    def __init__(self, sound_dir, pad_configs, volume=1, pitch_mode='nearest'):
+        self.sound_dir = Path(sound_dir)
+        self.volume = volume
+        self.resampler = Resampler(pitch_mode)
+        self.sounds = {} # (sound_file, pitch): float32 samples (None if it can't be loaded)
+
+        # track (row of a sequence) -> pad config, same mapping as IDX_TOPAD
+        self.pads = {
+            bank_map[pad['bank']] + ekey_map[pad['ekey']]: pad
+            for pad in pad_configs if pad['sound_file'] != "None"
+        }
+
+    def sound(self, sound_file, pitch):
+        key = (sound_file, pitch)
+        if key not in self.sounds:
+            data = None
+            path = self.sound_dir / sound_file
+            if path.exists():
+                data = decode_wav(path, RATE, CHANNELS)
+            if data is None:
+                print(f"Render: can't load {sound_file}, skipping its notes")
+            else:
+                data = self.resampler.pitch(data, pitch).astype(np.float32)
+            self.sounds[key] = data
+        return self.sounds[key]
+
+    def gain(self, pad):
+        # Sound.set_volume(0.04*volume*master), pygame keeps volumes in 1/128 steps
+        return int(128 * min(1.0, 0.04 * pad['volume'] * self.volume)) / 128
+
+    def render(self, parts, bpm, tail=True):
+        '''Mix parts, a list of (seq, swing) played one after the other, at bpm
+        tail: let the last sounds ring out past the end of the last sequence
+        Returns int16 (frames, 2) samples
+        '''
+        samples_per_pulse = RATE * 60.0 / (bpm * 24)
+        voices = {} # channel: [(start, samples, gain), ...] in start order
+        pulse_offset = 0
+
+        for seq, swing in parts:
+            play = Sequencer.swung(seq, swing)
+            # pulse-major order, tracks in order within a pulse (like Sequencer.build_events)
+            pulses, tracks = np.nonzero(play['f0'].T)
+            pitches = play['f1'].T[pulses, tracks]
+
+            for pulse, track, pitch in zip(pulses.tolist(), tracks.tolist(), pitches.tolist()):
+                pad = self.pads.get(track)
+                if pad is None:
+                    continue
+                data = self.sound(pad['sound_file'], pitch)
+                if data is None:
+                    continue
+
+                # absolute positions, so rounding never adds up to drift
+                start = int(round((pulse_offset + pulse) * samples_per_pulse))
+                voices.setdefault(pad['channel'], []).append((start, data, self.gain(pad)))
+            pulse_offset += play.shape[1]
+
+        # Choke: a new sound on a channel cuts the one playing (same as mixer.Channel.play)
+        notes = []
+        for channel_notes in voices.values():
+            for i, (start, data, gain) in enumerate(channel_notes):
+                end = start + data.shape[0]
+                if i + 1 < len(channel_notes):
+                    end = min(end, channel_notes[i+1][0])
+                if end > start:
+                    notes.append((start, end, data, gain))
+
+        length = int(round(pulse_offset * samples_per_pulse))
+        if tail and notes:
+            length = max(length, max(end for _, end, _, _ in notes))
+
+        out = np.zeros((length, CHANNELS), dtype=np.float32)
+        for start, end, data, gain in notes:
+            end = min(end, length)
+            if end > start:
+                out[start:end] += data[:end-start] * gain
+
+        np.clip(out, -32768, 32767, out=out)
+        return np.rint(out).astype(np.int16)
+
+# ============================================================================
+def render_seq(disk_dir, seq_num, loops=1, bpm=None, tail=True, **kwargs):
+    '''Render sequence seq_num of a disk, looped loops times | bpm defaults to the disk's'''
+    config, seqs = read_disk(disk_dir)
+    seq = seqs[seq_num]
+    if seq.size == 1:
+        raise ValueError(f"Sequence {seq_num} is empty")
+
+    swing = config['seqs'][seq_num]['swing']
+    renderer = Renderer(Path(disk_dir) / 'samples', config['pads'], **kwargs)
+    return renderer.render([(seq, swing)] * loops, bpm or config['global']['bpm'], tail)
+
+def render_song(disk_dir, song_num, bpm=None, tail=True, **kwargs):
+    '''Render a song of a disk | empty sequences in the song are skipped, like during playback'''
+    config, seqs = read_disk(disk_dir)
+    song = config['songs'][song_num]
+    parts = [
+        (seqs[seq_num], config['seqs'][seq_num]['swing'])
+        for seq_num in song['seqs'] if seqs[seq_num].size != 1
+    ]
+    if not parts:
+        raise ValueError(f"Song {song_num} has no sequences to play")
+
+    renderer = Renderer(Path(disk_dir) / 'samples', config['pads'], **kwargs)
+    return renderer.render(parts, bpm or song['bpm'], tail)
+
+# EOF
@@ -0,0 +1,162 @@
+'''Sequence file format: a typed, versioned replacement for the pickled sequences.npy
+
+Layout (little-endian):
+    header  | magic (8s), version (H), flags (H), sequence count (I)
+    index   | one entry per sequence: offset (Q), stored bytes (I), tracks (H), codec (H), pulses (I)
+    blocks  | one contiguous block per sequence: the (tracks, pulses) grid of (val, pitch) int32
+              records, raw or zlib compressed (mostly empty grids compress very well)
+
+An uninitialized sequence is stored as an empty block with pulses == 0. The index lets a single
+sequence be read without reading the others, and raw blocks can be memory mapped.
+
+Old disks are converted with convert() (see convert_seqs.py) or on their next save.
+'''
+from pathlib import Path
+import pickle
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'PYDMSEQ\x00'
+VERSION = 1
+
+HEADER = struct.Struct('<8sHHI')
+ENTRY = struct.Struct('<QIHHI')
+
+RAW = 0
+ZLIB = 1
+
+SEQ_DTYPE = np.dtype('<i4,<i4') # same layout as Sequencer.make_seq ('i,i')
+FILE_NAME = 'sequences.seq'
+LEGACY_NAME = 'sequences.npy'
+
+
+class SeqFileError(Exception):
+    pass
+
+# ============================================================================
+def uninit_seq():
+    '''Placeholder for an unused sequence (see Sequencer.delete_seq)'''
+    return np.zeros((), dtype='i,i')
+
+def write_seqs(path, seqs, compress=True):
+    '''Write an array/list of sequences to path'''
+    blocks, entries = [], []
+    offset = HEADER.size + ENTRY.size * len(seqs)
+
+    for seq in seqs:
+        if seq.size == 1 and seq.ndim == 0:
+            tracks, pulses, data = 0, 0, b''
+        else:
+            tracks, pulses = seq.shape
+            data = np.ascontiguousarray(seq, dtype=SEQ_DTYPE).tobytes()
+
+        codec = RAW
+        if compress and data:
+            data = zlib.compress(data, 6)
+            codec = ZLIB
+
+        entries.append(ENTRY.pack(offset, len(data), tracks, codec, pulses))
+        blocks.append(data)
+        offset += len(data)
+
+    tmp_path = Path(path).with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(seqs)))
+        f.writelines(entries)
+        f.writelines(blocks)
+
+    tmp_path.replace(path) # Don't leave a half written file if saving fails
+    return
+
+def read_index(f):
+    magic, version, flags, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise SeqFileError(f"{f.name} is not a pyDM404 sequence file")
+    if version > VERSION:
+        raise SeqFileError(f"{f.name} has a newer format version ({version})")
+
+    return [ENTRY.unpack(f.read(ENTRY.size)) for _ in range(count)]
+
+def read_block(f, entry, mmap=False):
+    offset, nbytes, tracks, codec, pulses = entry
+    if pulses == 0:
+        return uninit_seq()
+
+    if mmap and codec == RAW: # copy-on-write, edits never reach the file
+        return np.memmap(f.name, dtype=SEQ_DTYPE, mode='c', offset=offset, shape=(tracks, pulses))
+
+    f.seek(offset)
+    data = f.read(nbytes)
+    if codec == ZLIB:
+        data = zlib.decompress(data)
+    elif codec != RAW:
+        raise SeqFileError(f"Unknown codec {codec} in {f.name}")
+
+    seq = np.frombuffer(data, dtype=SEQ_DTYPE).reshape(tracks, pulses)
+    return seq.astype('i,i') # writable copy with the native layout the Sequencer uses
+
+def read_seqs(path, mmap=False):
+    '''Read every sequence into an object array (the layout Sequencer.sequences uses)'''
+    with open(path, 'rb') as f:
+        index = read_index(f)
+        seqs = np.empty(len(index), dtype=object)
+        for i, entry in enumerate(index):
+            seqs[i] = read_block(f, entry, mmap)
+    return seqs
+
+def read_seq(path, idx, mmap=False):
+    '''Read only the sequence at idx'''
+    with open(path, 'rb') as f:
+        index = read_index(f)
+        return read_block(f, index[idx], mmap)
+
+# ============================================================================
+# -- Legacy sequences.npy (object array of pickled arrays)
+class _NumpyUnpickler(pickle.Unpickler):
+    '''Only lets the pickle rebuild plain numpy arrays, never call anything else'''
+    _reconstruct = np.ndarray.__reduce__(np.zeros(1))[0]
+    allowed = {
+        ('numpy', 'ndarray'): np.ndarray,
+        ('numpy', 'dtype'): np.dtype,
+        ('numpy.core.multiarray', '_reconstruct'): _reconstruct,
+        ('numpy._core.multiarray', '_reconstruct'): _reconstruct,
+    }
+
+    def find_class(self, module, name):
+        try:
+            return self.allowed[(module, name)]
+        except KeyError:
+            raise SeqFileError(f"Refusing to load {module}.{name} from a sequence file") from None
+
+def read_legacy(path):
+    '''Read an old sequences.npy without trusting its pickle'''
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+
+        if dtype != object:
+            raise SeqFileError(f"Unexpected sequence data in {path}")
+
+        seqs = _NumpyUnpickler(f).load()
+
+    if not isinstance(seqs, np.ndarray) or seqs.shape != shape:
+        raise SeqFileError(f"Unexpected sequence data in {path}")
+
+    for seq in seqs:
+        if not isinstance(seq, np.ndarray) or seq.dtype.names != ('f0', 'f1'):
+            raise SeqFileError(f"Unexpected sequence data in {path}")
+    return seqs
+
+def convert(disk_dir):
+    '''Write sequences.seq next to a disk's sequences.npy (the old file is left in place)'''
+    disk_dir = Path(disk_dir)
+    seqs = read_legacy(disk_dir / LEGACY_NAME)
+    write_seqs(disk_dir / FILE_NAME, seqs)
+    return seqs
+
+# EOF
@@ -1,5 +1,5 @@
-from multiprocessing import Pipe
 from copy import deepcopy
+from time import perf_counter
 
 import numpy as np
 
@@ -46,9 +46,13 @@ class Sequencer:
     #swing = {0: "50%", 1: "54%", 2: "58%", 3: "63%", 4: "66%", 5:"71%"}
     swing_values = [[6,7,8,9], [18,19,20,21]]
 
+    # Seconds of upcoming pulses handed out by update ahead of the clock (0 = only fired pulses)
+    lookahead = 0.015
+
     def __init__(self, ClockGen):
-        self.receive_conn, self.send_conn = Pipe(True)
         self.clock = None
+        self.pulses_seen = 0 # Clock pulses already handled by update
+        self.pulse_time = 0.0 # perf_counter() time of the latest clock pulse
         self.ClockGen = ClockGen
         self.state = States()
 
@@ -60,6 +64,8 @@ class Sequencer:
         self.seq_configs = None
         self.error = False
         self.perform_seq = None
+        self.journal = set() # (track, pulse) cells of seq_record not yet copied to seq_play
+        self.edits = 0 # counts changes to seq_record, views can cache what they draw from it until it moves
 
     # ===========================
     def load_config(self, config):
@@ -89,17 +95,84 @@ class Sequencer:
         if self.seq_configs[self.seq_num]['swing'] != 0:
             self.copy_swing()
 
+        self.build_events()
+        self.build_quantize() # swing is per sequence
+        self.journal.clear()
+        self.edits += 1
         return
 
     def copy_swing(self):
         '''Copy notes to swing values if applicable'''
         swing = self.seq_configs[self.seq_num]['swing']
-        for swing_notes in self.swing_values:
+        self.seq_play = self.swung(self.seq_record, swing)
+        return
+
+    @classmethod
+    def swung(cls, seq, swing):
+        '''A copy of seq with its notes moved to the swing pulses (used for playback and rendering)'''
+        play = seq.copy()
+        if swing == 0:
+            return play
+
+        for swing_notes in cls.swing_values:
             start = swing_notes[swing]
             note = swing_notes[0]
-            self.seq_play[:, start::24] = self.seq_record[:, note::24].copy()
-            self.seq_play[:, note::24] = (0,0)
+            play[:, start::24] = seq[:, note::24]
+            play[:, note::24] = (0,0)
+
+        return play
 
+    def swing_pulse(self, pulse):
+        '''Where a note recorded on pulse lands in seq_play (None if swing overwrites it)'''
+        swing = self.seq_configs[self.seq_num]['swing']
+        if swing != 0:
+            for swing_notes in self.swing_values:
+                if pulse % 24 == swing_notes[0]:
+                    return pulse + swing
+                elif pulse % 24 == swing_notes[swing]:
+                    return None
+        return pulse
+
+    def sync_cell(self, idx, pulse):
+        '''Copy one recorded cell into seq_play (applying swing) | returns the seq_play pulse'''
+        play_pulse = self.swing_pulse(pulse)
+        if play_pulse is not None:
+            self.seq_play[idx, play_pulse] = self.seq_record[idx, pulse]
+        return play_pulse
+
+    def apply_journal(self):
+        '''Patch seq_play only at the (track, pulse) cells edited since the last sync
+        copy_rec_to_play (full rebuild) is still used when the sequence itself changes
+        '''
+        if len(self.journal) == 0:
+            return
+
+        pulses = {self.sync_cell(idx, pulse) for idx, pulse in self.journal}
+        pulses.discard(None)
+        for pulse in pulses:
+            self.refresh_events(pulse)
+
+        self.journal.clear()
+        return
+
+    # --------------------------------------------------------------------------
+    '''Event index: for each pulse of seq_play, an array of (track, pitch) rows to play.
+    Lets playback look up the few active notes instead of scanning all 32 tracks'''
+    def build_events(self):
+        if self.seq_play.ndim != 2: # uninit seq
+            self.events = []
+            return
+
+        pulses, tracks = np.nonzero(self.seq_play['f0'].T) # sorted by pulse
+        rows = np.column_stack((tracks, self.seq_play['f1'][tracks, pulses]))
+        counts = np.bincount(pulses, minlength=self.seq_play.shape[1])
+        self.events = np.split(rows, np.cumsum(counts)[:-1])
+        return
+
+    def refresh_events(self, pulse):
+        column = self.seq_play[:, pulse]
+        tracks = np.flatnonzero(column['f0'])
+        self.events[pulse] = np.column_stack((tracks, column['f1'][tracks]))
         return
 
     # --------------------------------------------------------------------------
@@ -195,7 +268,8 @@ class Sequencer:
         self.state.playing = True
         self.clock = self.ClockGen()
         self.clock.shared_bpm.value = self.bpm
-        self.clock.launch_process(self.send_conn)
+        self.pulses_seen = 0
+        self.clock.launch_process()
         return
 
     def stop(self):
@@ -222,22 +296,57 @@ class Sequencer:
     # --------------------------------------------------------------------------
     '''Check for sounds and/or metronome to play'''
     def update(self):
-        # if first entry is true, we are on valid pulse, so check for sound(s) to play
-        # if second entry is true, we need to play the metronome
-        seq_met = [False, False] # Document this better 
-        
+        '''Returns a list of ticks, one for every clock pulse since the last call (in order)
+        A tick is (pulse, met, events, time): met is the beat to click the metronome on (else None),
+        events is an array of (track, pitch) rows to play on that pulse, time is the perf_counter()
+        time the pulse is due (None when not looking ahead)
+        '''
+        ticks = []
+
         if self.step == True:
             self.step_end()
             self.step = False
 
-        if self.receive_conn.poll(): # Check if we have a clock pulse
-            _ignore = self.receive_conn.recv() # need to remove the item from the Pip conncetion
-            if self.state.playing:
-                self.step = True
-                seq_met[0] = True #self.to_play(snd_engine, pads)
-                if (self.pulse % 24 == 0 and self.state.met):
-                    seq_met[1] = True #snd_engine.play_met()
-        return seq_met
+        if self.clock is None or self.state.playing is False:
+            return ticks
+
+        # Check the shared pulse counter | Catch up on every pulse fired since the last update
+        count, self.pulse_time = self.clock.read_pulses()
+        period = 60.0 / (self.bpm * 24)
+        target = count
+
+        # Look ahead: also hand out pulses due within the next `lookahead` seconds. Pulses land on
+        # fixed deadlines, so pulse k is due at pulse_time + (k - (count - 1)) * period
+        if self.lookahead and count > 0:
+            ahead = int((perf_counter() + self.lookahead - self.pulse_time) / period)
+            target += max(0, min(ahead, int(self.lookahead / period) + 1))
+
+        first = self.pulses_seen
+        new_pulses = target - first
+        if new_pulses > 0:
+            self.pulses_seen = target
+
+        for i in range(new_pulses):
+            if i > 0: # Missed pulse(s), advance to the next one
+                self.step_end()
+                if self.state.playing is False:
+                    break
+
+            met = None
+            if (self.pulse % 24 == 0 and self.state.met):
+                met = self.beat
+
+            due = None
+            if self.lookahead:
+                due = self.pulse_time + (first + i - (count - 1)) * period
+            ticks.append((self.pulse, met, self.pulse_events(self.pulse), due))
+
+        self.step = len(ticks) > 0 and self.state.playing
+        return ticks
+
+    def pulse_events(self, pulse):
+        '''(track, pitch) rows of the notes to play on pulse'''
+        return self.events[pulse]
 
     def step_end(self):
         '''Called during Sequencer update | when we each the end of a bar/beat etc, set the next one'''
@@ -254,7 +363,7 @@ class Sequencer:
 
         if self.bar == int(self.seq_play.shape[1]/96): # We need to get seq length here
             self.bar = 0
-            self.copy_rec_to_play()
+            self.apply_journal() # Recorded notes join the loop from here
 
             if self.is_song:
                 self.check_seq_valid()
@@ -311,21 +420,27 @@ class Sequencer:
 
     def set_tc(self, val):
         self.tc = max(0, min(len(self.note_ppq)-1, self.tc+val))
+        self.build_quantize()
 
     # --------------------------------------------------------------------------
     # -- Record, Delete, Play Note Logic
     def record(self, idx, pitch):
         tick = self.auto_correct()
         self.seq_record[idx, tick] = (1, pitch)
+        self.journal.add((idx, tick))
+        self.edits += 1
     
     def delete(self, idx, whole = False):
         tick = self.auto_correct()
         self.seq_record[idx, tick] = 0 # Scale idx to bank
+        self.edits += 1
        
         if whole: 
             self.seq_record[idx, :] = 0 # 'Delete whole track
-        
-        self.copy_rec_to_play()
+            self.copy_rec_to_play()
+        else:
+            self.journal.add((idx, tick))
+            self.apply_journal()
         return
         
     # -- Grid record function
@@ -335,16 +450,49 @@ class Sequencer:
             self.seq_record[chan, pulse][1] = pitch #pads[chan].pitch
         if not record:
             self.seq_record[chan, pulse][0] = 0
-        self.copy_rec_to_play()
+        self.journal.add((chan, pulse))
+        self.edits += 1
+        self.apply_journal()
 
         return
         
     # -- AUTOCORRECT FUNCTION
+    def build_quantize(self):
+        '''Precompute auto correct for the current setting: a table mapping each pulse position
+        in a bar (0-95) to the position it corrects to (0-96, 96 being the next bar's downbeat)
+        '''
+        targets = self.note_ppq[self.tc]
+        heard = targets # Where the target notes are heard during playback
+
+        swing = self.seq_configs[self.seq_num]['swing']
+        if swing != 0:
+            # Swung positions are overwritten by copy_swing, so they can't be targets. The 6/18
+            # notes are heard late, so measure the distance to where they are actually played
+            swung = [swing_notes[swing] for swing_notes in self.swing_values]
+            straight = [swing_notes[0] for swing_notes in self.swing_values]
+            targets = targets[~np.isin(targets, swung)]
+            heard = targets + swing*np.isin(targets, straight)
+
+        offsets = np.arange(24)[:, None] # pulse position inside a beat
+        beat_table = targets[np.argmin(np.abs(offsets - heard), axis=1)]
+        self.quantize = np.concatenate([beat_table + 24*beat for beat in range(4)]).tolist()
+        return
+
+    def clock_pulse(self):
+        '''The pulse the clock is on | self.pulse runs up to `lookahead` ahead of it (see update), a
+        hit is heard against the latest pulse fired so it is corrected from there
+        '''
+        pulse = self.pulse
+        if self.clock is not None and self.state.playing:
+            count, _ = self.clock.read_pulses()
+            handed = self.pulses_seen - 1 if self.step else self.pulses_seen # clock pulse self.pulse is on
+            pulse -= max(0, handed - max(0, count - 1))
+        return pulse % self.seq_play.shape[1]
+
     def auto_correct(self):
         '''Corrects input to nearest value based on auto correct settings'''
-        scaled_ac = self.note_ppq[self.tc] + 24*self.beat + 96*self.bar
-        correct_to_idx = np.argmin(np.abs(self.pulse - scaled_ac))
-        correct_to = scaled_ac[correct_to_idx]
+        pulse = self.clock_pulse()
+        correct_to = 96*(pulse // 96) + self.quantize[pulse % 96]
         if correct_to == self.seq_play.shape[1]:
             correct_to = 0
         return correct_to
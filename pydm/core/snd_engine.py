@@ -1,9 +1,18 @@
 from pathlib import Path
+from time import perf_counter
 import json
+import math
+import threading
 
 import pygame.sndarray
 import numpy as np
 
+from pydm.core.dispatcher import Dispatcher
+from pydm.core.pitches import PitchTable, PitchCache, PitchStore, PITCH_BUDGET, STORE_BUDGET
+from pydm.core.loader import SampleLoader
+from pydm.core.mixer import SoftMixer, PygameSink
+from pydm.core.peaks import PeakPyramid
+
 # ============================================================================
 # -- Mapping dictionaries 
 bank_map = {"A": 0, "B": 8, "C": 16, "D": 24}
@@ -17,8 +26,13 @@ for bank, bank_val in bank_map.items():
         IDX_TOPAD[bank_val+val] = (bank, ek)
 
 
-def moog_filter(samples, sample_rate=44100, cutoff=250, resonance=0.1, drive=1.0):
+class MoogFilter:
     '''
+    Moog ladder low pass filter (see moog_filter) | the filter state is kept between calls to process,
+    so a long sound can be filtered a block at a time. Every channel has its own state.
+    The ladder is a recursion (each sample needs the last), so it can't be vectorized over time:
+    the inner loop works on plain floats with math.tanh, which is far cheaper than numpy on scalars
+
     Copyright 2012 Stefano D'Angelo <zanga.mail@gmail.com>
 
     Permission to use, copy, modify, and/or distribute this software for any
@@ -33,66 +47,116 @@ def moog_filter(samples, sample_rate=44100, cutoff=250, resonance=0.1, drive=1.0
     ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
     OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
     '''
-    
     VT = 0.312
-    MOOG_PI = 3.14159265358979323846264338327950288
-    x = (MOOG_PI * cutoff) / sample_rate
-    g = 4.0 * MOOG_PI * VT * cutoff * (1.0 - x) / (1.0 + x)
-
-    V = [0,0,0,0]
-    dV = [0,0,0,0]
-    tV = [0,0,0,0]
-
-    dV0 = 0
-    dV1 = 0
-    dV2 = 0
-    dV3 = 0
-
-    VT2 = (2.0 * VT)
-    SR2 = (2.0 * sample_rate)
-
-    filtered_samples = []
-    for sample in samples:
-        x = (drive*sample + resonance*V[3]) / VT2
 
-        dV0 = -g*(np.tanh(x) + tV[0])
-        V[0] += (dV0 + dV[0]) / SR2
-        dV[0] = dV0
-        tV[0] = np.tanh(V[0] / VT2)
-
-        dV1 = g*(tV[0] - tV[1])
-        V[1] += (dV1 + dV[1]) / SR2
-        dV[1] = dV1
-        tV[1] = np.tanh(V[1] / VT2)
-
-        dV2 = g*(tV[1] - tV[2])
-        V[2] += (dV2 + dV[2]) / SR2
-        dV[2] = dV2
-        tV[2] = np.tanh(V[2] / VT2)
-
-        dV3 = g*(tV[2] - tV[3])
-        V[3] += (dV3 + dV[3]) / SR2
-        dV[3] = dV3
-        tV[3] = np.tanh(V[3] / VT2)
-
-        filtered_samples.append(V[3])
-
-    output = np.array(filtered_samples)
-    y_out = np.int16(output * 2 ** 15) #should be 16? (no 16 is for unsigned)
+    def __init__(self, channels=2, sample_rate=44100, cutoff=250, resonance=0.1, drive=1.0):
+        x = (math.pi * cutoff) / sample_rate
+        self.g = 4.0 * math.pi * self.VT * cutoff * (1.0 - x) / (1.0 + x)
+        self.sample_rate = sample_rate
+        self.resonance = resonance
+        self.drive = drive
+        # per channel: V[0..3], dV[0..3], tV[0..3] (V and dV scaled, see _ladder)
+        self.state = [[0.0] * 12 for _ in range(channels)]
+
+    def process(self, block):
+        '''Filter a float block, (frames, channels) scaled to -1..1 | returns float64 (frames, channels)'''
+        out = np.empty(block.shape, dtype=np.float64)
+        # The input drive doesn't depend on the state, so it is done for the whole block in numpy
+        inputs = block * (self.drive / (2.0 * self.VT))
+        for c, state in enumerate(self.state):
+            out[:, c], self.state[c] = self._ladder(inputs[:, c].tolist(), state)
+        out *= 2.0 * self.VT # back from the scaled voltages of _ladder
+        return out
+
+    def _ladder(self, inputs, state):
+        '''The recursion itself, on driven inputs (see process). The stage voltages are kept divided by
+        2*VT and the steps d already multiplied by the integration constant, so the loop is down to the
+        tanh and the adds (the filter is the same, the state is only scaled)
+        '''
+        tanh = math.tanh
+        step = self.g / (2.0 * self.sample_rate) / (2.0 * self.VT)
+        resonance = self.resonance
+        V0, V1, V2, V3, dV0, dV1, dV2, dV3, tV0, tV1, tV2, tV3 = state
+
+        filtered = []
+        append = filtered.append
+        for x in inputs:
+            d = -step*(tanh(x + resonance*V3) + tV0)
+            V0 += d + dV0
+            dV0 = d
+            tV0 = tanh(V0)
+
+            d = step*(tV0 - tV1)
+            V1 += d + dV1
+            dV1 = d
+            tV1 = tanh(V1)
+
+            d = step*(tV1 - tV2)
+            V2 += d + dV2
+            dV2 = d
+            tV2 = tanh(V2)
+
+            d = step*(tV2 - tV3)
+            V3 += d + dV3
+            dV3 = d
+            tV3 = tanh(V3)
+
+            append(V3)
+
+        return filtered, [V0, V1, V2, V3, dV0, dV1, dV2, dV3, tV0, tV1, tV2, tV3]
 
+def moog_filter(samples, sample_rate=44100, cutoff=250, resonance=0.1, drive=1.0):
+    '''Low pass filter samples (1d, or 2d (frames, channels), scaled to -1..1) | returns int16'''
+    block = samples if samples.ndim == 2 else samples[:, None]
+    ladder = MoogFilter(block.shape[1], sample_rate, cutoff, resonance, drive)
+    output = ladder.process(block) * 2 ** 15
+    y_out = np.clip(output, -2 ** 15, 2 ** 15 - 1).astype(np.int16)
+    return y_out if samples.ndim == 2 else y_out[:, 0]
+
+def moog_filter_job(samples, sample_rate=44100, cutoff=250, resonance=0.1, drive=1.0, block=8192):
+    '''moog_filter as a job (see pydm.core.jobs): filters block frames at a time, yielding the progress
+    (the filter keeps its state between blocks, so the result is the same) | returns int16 (frames, channels)
+    '''
+    ladder = MoogFilter(samples.shape[1], sample_rate, cutoff, resonance, drive)
+    y_out = np.empty(samples.shape, dtype=np.int16)
+    length = samples.shape[0]
+    for start in range(0, length, block):
+        output = ladder.process(samples[start:start + block]) * 2 ** 15
+        y_out[start:start + block] = np.clip(output, -2 ** 15, 2 ** 15 - 1)
+        yield min(length, start + block) / length
     return y_out
-    
+
 class SNDEngine:
-    def __init__(self, mixer, root_dir):
+    def __init__(self, mixer, root_dir, pitch_budget=PITCH_BUDGET, pitch_mode='nearest', workers=None,
+                 store_budget=STORE_BUDGET, soft_mixer=False, load_timing=False):
         self.mixer = mixer
+        self.load_timing = load_timing # print the timing of every sound of a disk load
         self.metup = mixer.Sound(root_dir / 'assets/MetronomeUp.wav')
         self.met = mixer.Sound(root_dir / 'assets/Metronome.wav')
         self.volume = 1
         self.root_dir = root_dir
+        self.dispatcher = Dispatcher() # Plays sequenced sounds at their due time
+        # Sequenced sounds are played from the dispatcher (and sink) threads, pads and previews from the
+        # main loop: pygame.mixer calls hold this lock (see channel_play)
+        self.mixer_lock = threading.Lock()
+        # Pitched sounds are made on first use, and kept on disk for the next time (store_budget=0 to disable)
+        self.pitch_store = PitchStore(root_dir / 'assets/temp/pitches', store_budget) if store_budget else None
+        self.pitch_cache = PitchCache(pitch_budget, pitch_mode, self.pitch_store)
+        self.loader = SampleLoader(workers) # Decodes a disk's samples on a process pool
+
+        # Optional software mixer: voices are mixed in numpy instead of on the 9 pygame channels
+        self.soft_mixer = None
+        if soft_mixer:
+            self.soft_mixer = SoftMixer(PygameSink(mixer, lock=self.mixer_lock))
+            self.soft_mixer.start()
+        self.sounds = {}
 
     def load_sounds(self, sound_dir):
+        for name in self.sounds:
+            self.unset_pitches(name)
+
         self.sounds = {
-            snd_path.name: {'path': snd_path, 'pitches': None}
+            snd_path.name: {'path': snd_path, 'pitches': None, 'peaks': None}
             for snd_path in sound_dir.iterdir()
         }
         return
@@ -103,62 +167,140 @@ class SNDEngine:
         return
 
     def load_sound(self, snd_path):
-        self.sounds[snd_path.name] = {'path': snd_path, 'pitches': None}
+        if snd_path.name in self.sounds:
+            self.unset_pitches(snd_path.name)
+        self.sounds[snd_path.name] = {'path': snd_path, 'pitches': None, 'peaks': None}
         return
 
+    def peaks(self, sound_file, snd_array):
+        '''Waveform peaks (for the editors) of a sound, snd_array is its data | made on first use,
+        and kept until the sound is reloaded
+        '''
+        snd = self.sounds[sound_file]
+        if snd.get('peaks') is None:
+            snd['peaks'] = PeakPyramid(snd_array)
+        return snd['peaks']
+
     def set_pitches(self, sound_file):
         if sound_file != 'None':
             snd = self.sounds.get(sound_file, False)
             if snd:
                 snd_path = snd['path']
-                snd_array = pygame.sndarray.array(self.mixer.Sound(snd_path))
-                self.sounds[sound_file]['pitches'] = self.pitch_it(snd_array)
+                sound = self.mixer.Sound(snd_path)
+                snd_array = pygame.sndarray.array(sound)
+                self.unset_pitches(sound_file)
+                self.sounds[sound_file]['pitches'] = PitchTable(snd_array, sound, self.pitch_cache)
                 missing_snd =  False
             else:
                 missing_snd = True
 
         return missing_snd
 
+    def set_pad_pitches(self, pads):
+        '''set_pitches for every pad of a disk, with the samples decoded in parallel by the loader
+        The pitch each pad is tuned to is made up front too | returns the set of missing sound files
+        '''
+        jobs = {}
+        missing = set()
+        for pad in pads:
+            snd = self.sounds.get(pad.sound_file)
+            if snd is None:
+                missing.add(pad.sound_file)
+                continue
+            path, pitches = jobs.setdefault(pad.sound_file, (snd['path'], set()))
+            pitches.add(pad.pitch)
+
+        if not jobs:
+            return missing
+
+        start = perf_counter()
+        mode = self.pitch_cache.resampler.mode
+        results = self.loader.load(jobs, self.mixer.get_init(), mode, self.pitch_store)
+        for sound_file, data, key, pitched, timing in results:
+            wrap_start = perf_counter()
+            if data is None:
+                self.set_pitches(sound_file)
+                if self.load_timing:
+                    print(f"  {sound_file}: loaded by mixer in {1000*(perf_counter()-wrap_start):.1f} ms")
+                continue
+
+            self.unset_pitches(sound_file)
+            table = PitchTable(data, pygame.sndarray.make_sound(data), self.pitch_cache, key)
+            for pitch, pitch_data in pitched.items():
+                sound = pygame.sndarray.make_sound(pitch_data)
+                self.pitch_cache.add((table, pitch), sound, pitch_data.nbytes)
+            self.sounds[sound_file]['pitches'] = table
+
+            if self.load_timing:
+                print(
+                    f"  {sound_file}: decode {1000*timing['decode']:.1f} ms, "
+                    f"pitch {1000*timing['pitch']:.1f} ms ({len(pitched)}, {timing['stored']} stored), "
+                    f"wrap {1000*(perf_counter()-wrap_start):.1f} ms"
+                )
+
+        where = f"on {self.loader.workers} workers" if self.loader.used_pool else "in process"
+        print(f"Loaded {len(jobs)} sounds in {1000*(perf_counter()-start):.0f} ms ({where})")
+        return missing
+
     def unset_pitches(self, name):
         # Used to unset/remove pitched sounds
-        self.sounds[name]['pitches'] = None
+        snd = self.sounds.get(name)
+        if snd and snd['pitches'] is not None:
+            self.pitch_cache.drop(snd['pitches'])
+            snd['pitches'] = None
+        return
+
+    def stop_scheduled(self):
+        '''Drop the sequenced sounds handed out ahead of the clock (Sequencer.lookahead) | on stop'''
+        self.dispatcher.clear()
+        if self.soft_mixer is not None:
+            self.soft_mixer.cancel()
         return
 
     def play_error(self):
         sound = self.mixer.Sound(self.root_dir / 'assets/error-beep.wav')
-        sound.set_volume(0.1*self.volume)
-        self.mixer.Channel(0).play(sound)
+        self.channel_play(0, sound, 0.1*self.volume)
         return
 
-    def play_met(self, beat):
+    def play_met(self, beat, when=None):
         if beat == 0:
-            self.metup.set_volume(0.4*self.volume)
-            self.mixer.Channel(0).play(self.metup)
+            self.play(0, self.metup, 0.4*self.volume, when)
         else:
-            self.met.set_volume(0.4*self.volume)
-            self.mixer.Channel(0).play(self.met)
+            self.play(0, self.met, 0.4*self.volume, when)
         return
 
-    def sequncer_play(self, sequencer, pad_banks):
-        # Loop over pads/'tracks' | 32 possible pads/'tracks'
-        for idx in range(32):
-            val, pitch = sequencer.seq_play[idx, sequencer.pulse]
-            if val:
+    def sequncer_play(self, ticks, pad_banks, met=False):
+        '''Play a batch of ticks from Sequencer.update | met: also click the metronome'''
+        for pulse, beat, events, when in ticks:
+            if met and beat is not None:
+                self.play_met(beat, when)
+            # events are (track, pitch) | 32 possible pads/'tracks'
+            for idx, pitch in events.tolist():
                 bank, ekey = IDX_TOPAD.get(idx)
                 pad = pad_banks[bank][ekey]
-                self.play_sound(pad, pitch)
+                self.play_sound(pad, pitch, when)
         return
 
-    def play_sound(self, pad, pitch=None):
+    def play_sound(self, pad, pitch=None, when=None):
         if pad.sound_file != "None":
             if pitch is None:
                 sound = self.sounds[pad.sound_file]['pitches'][pad.pitch]
             else:
                 sound = self.sounds[pad.sound_file]['pitches'][pitch]
 
-            chan = pad.channel
-            sound.set_volume(0.04*pad.volume*self.volume)
-            self.mixer.Channel(chan).play(sound)
+            self.play(pad.channel, sound, 0.04*pad.volume*self.volume, when)
+        return
+
+    def play(self, chan, sound, volume, when=None):
+        '''Play sound on a mixer channel now, or hand it to the dispatcher to play at when
+        With the soft mixer the channel is the voice's choke group, and when is exact to the frame
+        '''
+        if self.soft_mixer is not None:
+            self.soft_mixer.play(pygame.sndarray.samples(sound), volume, chan, when)
+        elif when is None:
+            self.channel_play(chan, sound, volume)
+        else:
+            self.dispatcher.schedule(when, self.play, chan, sound, volume)
         return
 
     def preview(self, sound_file):
@@ -168,32 +310,17 @@ class SNDEngine:
             sound_path = sound['path']
             sound = self.mixer.Sound(sound_path)
             if sound.get_length() > 0: # need to check length of sound (cant play sound with no data!)
-                sound.set_volume(0.04*12*self.volume)
-                self.mixer.Channel(0).play(sound)
+                self.channel_play(0, sound, 0.04*12*self.volume)
         return
 
-    @staticmethod
-    def pitch_it(data):
-        '''Pitch algorithm - based on the SP1200 algorithm'''
-        pitch_snd = []
-
-        # Get lower pitch data (-1 thru -12 semitones)
-        for n in np.arange(1,13):
-            idx = np.arange(0, data.shape[0] * 2**(n/12) ) * 2**(-n/12)
-            idx_floor = np.floor(idx).astype("int")
-            new_data = data[idx_floor[idx_floor < data.shape[0]]]
-            pitch_snd.append(pygame.sndarray.make_sound(new_data))
-
-        pitch_snd.reverse() # Reverse the list sp lowest pitch is at the bottom
-        pitch_snd.append(pygame.sndarray.make_sound(data))
-
-        # get higher pitch data (+1 thru +12 semitones)
-        for n in np.arange(1,13):
-            idx = np.arange(0, data.shape[0]) * 2**(n/12)
-            idx_floor = np.floor(idx).astype("int") # can try round
-            new_data = data[idx_floor[ idx_floor < data.shape[0]]]
-            pitch_snd.append(pygame.sndarray.make_sound(new_data))
-
-        return pitch_snd
+    def channel_play(self, chan, sound, volume=None):
+        '''Set the volume of sound and play it on mixer channel chan, as one step | the same Sound can be
+        started from the main loop and the dispatcher thread at once, each with its own volume
+        '''
+        with self.mixer_lock:
+            if volume is not None:
+                sound.set_volume(volume)
+            self.mixer.Channel(chan).play(sound)
+        return
 
 # EOF
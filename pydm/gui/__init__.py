@@ -1,2 +1,3 @@
 from pydm.gui.lcd import LCD
 from pydm.gui.panel import Panel
+from pydm.gui.stats import FrameStats, STATS_KEY
@@ -1,8 +1,12 @@
+from collections import OrderedDict
+from pathlib import Path
 import wave
 
 import pygame
 from pygame.locals import *
 
+from pydm.core.peaks import PeakPyramid
+
 def write_wave(path, audio):
     # Convert to (little-endian) 16 bit integers.
     audio = audio.astype("<h")
@@ -14,15 +18,52 @@ def write_wave(path, audio):
         f.writeframes(audio.tobytes())
     return
 
+def write_waves(files):
+    '''write_wave as a job (see pydm.core.jobs) | files: [(path, audio)], returns the paths written
+    Each file is written under a temporary name and renamed when complete. If the job is cancelled
+    (or fails) the files it already wrote are removed again, so it is all or nothing
+    '''
+    written = []
+    tmp_path = None
+    try:
+        for path, audio in files:
+            tmp_path = Path(path).with_suffix('.tmp')
+            write_wave(tmp_path, audio)
+            tmp_path.replace(path)
+            written.append(path)
+            yield len(written) / len(files)
+    except BaseException: # GeneratorExit when cancelled
+        if tmp_path is not None:
+            tmp_path.unlink(missing_ok=True)
+        for path in written:
+            Path(path).unlink(missing_ok=True)
+        raise
+    return written
+
 class WaveEditor:
-    def __init__(self, lcd, snd_array):
+    '''Waveform view with markers | marks are positions in frames, the view (view_start:view_end frames)
+    can be zoomed and scrolled. Flags (rects) and lines (edit_lines) are made from the marks for the view
+    '''
+    MIN_SPAN = 64 # frames across the LCD at the highest zoom
+    ZOOM = 1.5 # zoom factor of one wheel notch / key press
+    SCROLL = 60 # pixels scrolled per key press / wheel notch
+    PREVIEWS = 32 # Sounds of auditioned regions kept (see preview)
+
+    def __init__(self, lcd, snd_array, peaks=None):
         self.edit_lines = [] #chop_lines
+        self.marks = [] # marker positions (frames)
         self.start = 0
         self.end = None
         self.rect = pygame.Rect(0,0,14,15)
         self.rects = []
 
         self.snd_array = snd_array
+        self.length = 0 # frames in snd_array
+        self.peaks = peaks # PeakPyramid of snd_array, made if not given (e.g. SNDEngine.peaks)
+        self.view_start = 0
+        self.view_end = 0
+        self.make_snd = pygame.sndarray.make_sound
+        self.previews = OrderedDict() # (start, end): Sound, least recently played first
 
         # Get LCD parameters and make sub-surface
         self.lcd = lcd
@@ -34,44 +75,138 @@ class WaveEditor:
         self.wav_surface = pygame.Surface((width, height))
         self.wav_surface.fill(lcd.g2)
 
-        # the main wave surface (we draw once, save and reblit)
+        # the main wave surface (we draw once per view, save and reblit)
         self.wavform = pygame.Surface((width, height))
         self.wavform.fill(lcd.g2) #wav_surface2
 
         self.make_waveform()
 
     def remake_waveform(self):
-        self.wavform.fill(self.lcd.g2)
+        self.peaks = None # the sound was edited
+        self.previews.clear()
         self.make_waveform()
         return
 
     def make_waveform(self):
-        lcd = self.lcd
-        y = self.snd_array[:,0].copy() # one channel only (left/right)
-        length = len(y) # how many samples
+        if self.peaks is None:
+            self.peaks = PeakPyramid(self.snd_array)
+        if self.peaks.length != self.length: # new or truncated sound: show all of it
+            self.length = self.peaks.length
+            self.view_start, self.view_end = 0, self.length
+        self.draw_waveform()
+        self.place_marks()
+        return
 
-        # Pixels per Sample | get ratio of screen size to number samples
-        # Check/fix length == 0 | else display error
-        if length != 0:
-            scale_factor = lcd.WIDTH/length
+    def draw_waveform(self):
+        '''Draw the frames in view: one vertical line per pixel column, from the min to the max of the
+        frames under it (same cost at any zoom, see PeakPyramid)
+        '''
+        lcd = self.lcd
+        self.wavform.fill(lcd.g2)
 
-            # Set x postion based on scale factor
-            self.x = [int((i+1)*scale_factor) for i in range(length)]
+        if self.length != 0 and self.peaks.peak != 0:
+            mins, maxs = self.peaks.columns(self.view_start, self.view_end, lcd.WIDTH)
 
             '''This part is tricky, need to fit the wave form inside the LCD area'''
-            ratio = ((2**15)-1000) / max(abs(y)) # Normalize Ratio
-            ys = y * ratio # Scale y to full scale
-            
-            # Add the max (all y values positive), renormalize, then scale
-            ys = (ys + (2**15)) / ((2**15) * 2) * self.height
-            y2 = ys.astype(int) # convert to int for rendering
-
-            self.coords = list(zip(self.x, y2)) # Make (x,y) coords
-            pygame.draw.lines(self.wavform, (0,0,0), False, self.coords, 1) # Draw wavform
+            ratio = ((2**15)-1000) / self.peaks.peak # Normalize Ratio
+            # Scale y to full scale, add the max (all y values positive), renormalize, then scale
+            top = ((mins * ratio + (2**15)) / ((2**15) * 2) * self.height).astype(int)
+            bottom = ((maxs * ratio + (2**15)) / ((2**15) * 2) * self.height).astype(int)
+
+            for x, (y1, y2) in enumerate(zip(top.tolist(), bottom.tolist())):
+                pygame.draw.line(self.wavform, (0,0,0), (x, y1), (x, y2), 1) # Draw wavform
+        return
+
+    # --------------------------------------------------------------------------
+    @property
+    def span(self):
+        return max(1, self.view_end - self.view_start)
+
+    @property
+    def zoom_level(self):
+        return self.length / self.span
+
+    def x_of(self, pos):
+        '''LCD x of frame pos (outside 0-WIDTH when it is out of view)'''
+        return int((pos - self.view_start) * self.lcd.WIDTH / self.span)
+
+    def pos_of(self, x):
+        '''Frame under LCD x, clamped to the sound'''
+        pos = self.view_start + round(x * self.span / self.lcd.WIDTH)
+        return max(0, min(self.length, pos))
+
+    def frames_per_pixel(self):
+        return max(1, self.span // self.lcd.WIDTH)
+
+    def set_view(self, start, span):
+        span = max(min(self.MIN_SPAN, self.length), min(self.length, int(span)))
+        start = max(0, min(self.length - span, int(start)))
+        self.view_start, self.view_end = start, start + span
+        self.draw_waveform()
+        self.place_marks()
+        return
+
+    def zoom(self, factor, x=None):
+        '''Zoom in (factor > 1) or out, keeping the frame under LCD x (default the middle) in place'''
+        if x is None or not 0 <= x <= self.lcd.WIDTH:
+            x = self.lcd.WIDTH // 2
+        anchor = self.pos_of(x)
+        span = self.span / factor
+        self.set_view(anchor - x * span / self.lcd.WIDTH, span)
+        return
+
+    def scroll(self, pixels):
+        self.set_view(self.view_start + pixels * self.span / self.lcd.WIDTH, self.span)
+        return
+
+    def view_event(self, event, mx=None):
+        '''Zoom/scroll on the mouse wheel (at mx, LCD x) or keys: Z/X zoom in/out, </> scroll
+        Returns True if the event was used
+        '''
+        if event.type == pygame.MOUSEWHEEL:
+            if event.x or pygame.key.get_mods() & KMOD_SHIFT:
+                self.scroll((event.x or -event.y) * self.SCROLL)
+            else:
+                self.zoom(self.ZOOM ** event.y, mx)
+        elif event.type == pygame.KEYDOWN and event.key in (K_z, K_x):
+            self.zoom(self.ZOOM if event.key == K_z else 1 / self.ZOOM)
+        elif event.type == pygame.KEYDOWN and event.key in (K_COMMA, K_PERIOD):
+            self.scroll(self.SCROLL if event.key == K_PERIOD else -self.SCROLL)
+        else:
+            return False
+        return True
+
+    def preview(self, start, end):
+        '''Sound of frames start:end, made the first time the region is played'''
+        key = (start, end)
+        sound = self.previews.get(key)
+        if sound is None:
+            sound = self.make_snd(self.snd_array[start:end, :])
+            self.previews[key] = sound
+            if len(self.previews) > self.PREVIEWS:
+                self.previews.popitem(last=False)
         else:
-            self.x = [0]
+            self.previews.move_to_end(key)
+        return sound
+
+    # --------------------------------------------------------------------------
+    def place_marks(self):
+        '''Make the flags and lines of the marks for the current view'''
+        self.rects = []
+        self.edit_lines = []
+        for pos in self.marks:
+            x = self.x_of(pos)
+            rect = self.rect.copy()
+            rect.centerx = x
+            self.rects.append(rect)
+            self.edit_lines.append([(x, self.lcd.HEIGHT), (x, 0)])
         return
 
+    def mark_at(self, x):
+        '''Index of the mark whose flag is under LCD x, or None'''
+        collide = pygame.Rect((x, 0), (1, 1)).collidelistall(self.rects)
+        return collide[0] if collide else None
+
     def draw_editor(self, idx):
         self.wav_surface.fill(self.lcd.g2)
         self.wav_surface.blit(self.wavform, (0,0))
@@ -93,43 +228,44 @@ class WaveEditor:
 
 
 class Chopper(WaveEditor):
-    def __init__(self, lcd, snd_array):
-        super().__init__(lcd, snd_array)
-        self.make_snd =  pygame.sndarray.make_sound
-        self.chop_play = {K_a: self.make_snd(self.snd_array[0:, :])}
-
-    # --------------------------------------------------------------------------
-    def make_slice(self):
-        pos = pygame.mouse.get_pos()[0]-self.lcd.offset #100 # Adjust for offset
-        percent = pos/self.lcd.WIDTH
-        end = int(percent*len(self.x))
-
-        if len(self.edit_lines) < 7:
-            self.edit_lines.append([(pos, self.lcd.HEIGHT), (pos, 0)])
-            self.edit_lines.sort()
+    MAX_MARKS = 7 # 8 slices, one per pad
 
-            self.update_slices()
+    def __init__(self, lcd, snd_array, peaks=None):
+        super().__init__(lcd, snd_array, peaks)
+        self.update_slices()
 
-            self.rects = []
-            for line in self.edit_lines:
-                rect = self.rect.copy()
-                rect.centerx = line[0][0]
-                self.rects.append(rect)
+    # --------------------------------------------------------------------------
+    def make_slice(self, x):
+        '''Add a slice point at LCD x | returns its mark index (None if there are enough)'''
+        if len(self.marks) >= self.MAX_MARKS:
+            return None
+        pos = max(1, self.pos_of(x))
+        self.marks.append(pos)
+        return self.move_mark(len(self.marks)-1, pos)
+
+    def move_mark(self, idx, pos):
+        '''Move slice point idx to frame pos | returns its index once the points are sorted again'''
+        self.marks[idx] = max(1, min(self.length, pos))
+        order = sorted(range(len(self.marks)), key=lambda i: self.marks[i])
+        self.marks = [self.marks[i] for i in order]
+        self.place_marks()
+        return order.index(idx)
+
+    def set_marks(self, marks):
+        '''Replace all slice points (frames), e.g. with the hits found by auto chop'''
+        self.marks = sorted(max(1, min(self.length, pos)) for pos in marks)[:self.MAX_MARKS]
+        self.place_marks()
+        self.update_slices()
+        return
 
-        self.rects.sort()
+    def remove_mark(self, idx):
+        self.marks.pop(idx)
+        self.place_marks()
+        self.update_slices()
         return
 
     def update_slices(self):
-        slice_x = [0]
-        for line in self.edit_lines:
-            x = line[0][0]
-            percent = x/self.lcd.WIDTH
-            slice_x.append(int(percent*len(self.x)))
-
-        self.make_chops(slice_x)
-        self.rects.sort()
-        self.edit_lines.sort()
-
+        self.make_chops([0] + self.marks)
         return
     
     # --------------------------------------------------------------------------
@@ -141,64 +277,57 @@ class Chopper(WaveEditor):
                 if idx == 0:
                     chops[idx] = [0, slices[idx+1]]
                 elif idx == len(slices)-1:
-                    chops[idx] = [val, len(self.x)]
+                    chops[idx] = [val, self.length]
                 else:
                     chops[idx] = [val, slices[idx+1]]
         else:
-            chops[0] = (0, len(self.x))
+            chops[0] = [0, self.length]
 
         for chop in chops: #start cannot equal end
             if chop[0] == chop[1]:
                 chop[1] += 10 # Increase? Also fix "flags" can go off screen
 
+        # Slices are only (start, end) pairs, Sounds are made when played (see preview)
         pad_keys = [K_a, K_s, K_d, K_f, K_g, K_h, K_j, K_k] # From import PAD_KEYS
-        sounds = [self.make_snd(self.snd_array[start:end, :]) for start, end in chops]
-
         self.endpoints = {i:(vals[0], vals[1]) for i, vals in enumerate(chops)}
-        self.chop_play = {pad_keys[i]: val for i, val in enumerate(sounds)}
+        self.chop_play = {pad_keys[i]: (start, end) for i, (start, end) in self.endpoints.items()}
+
+    def chop_arrays(self):
+        '''{pad key: samples of its slice} (views, not copies)'''
+        return {key: self.snd_array[start:end, :] for key, (start, end) in self.chop_play.items()}
 
     def play_slice(self, event, snd_engine):
         chop = self.chop_play.get(event.key, False)
         if chop:
-            snd_engine.mixer.Channel(0).play(chop)
+            snd_engine.channel_play(0, self.preview(*chop))
 
         return
 
 # ==========================================================================
 class Truncator(WaveEditor):
-    def __init__(self, lcd, snd_array):
-        super().__init__(lcd, snd_array)
-        self.make_snd =  pygame.sndarray.make_sound
+    def __init__(self, lcd, snd_array, peaks=None):
+        super().__init__(lcd, snd_array, peaks)
         self.init_endpoints()
     
     def init_endpoints(self):
-        self.edit_lines = []
-        self.end = self.x[-1]
-        self.start = 0
-        # Comment all this | end lines not needed?
-        self.edit_lines.append([(self.start, self.lcd.HEIGHT), (self.start, 0)])
-        self.edit_lines.append([(self.end, self.lcd.HEIGHT), (self.end, 0)])
+        self.marks = [0, self.length]
+        self.place_marks()
         self.update_endpoints()
 
-    def update_endpoints(self):
-        self.rects = []
-        for idx, line in enumerate(self.edit_lines):
-            x = line[0][0]
-            percent = x/self.lcd.WIDTH
-
-            rect = self.rect.copy()
-            rect.centerx = line[0][0]
-            self.rects.append(rect)
-
-            loc = int(percent*len(self.x))
-            if idx == 0:
-                self.start = loc #line[0][0]
-            else:
-                self.end = loc #line[0][0]
+    def move_mark(self, idx, pos):
+        '''Move the start (0) or end (1) mark to frame pos, they can't cross'''
+        if idx == 0:
+            pos = max(0, min(pos, self.marks[1]))
+        else:
+            pos = max(self.marks[0], min(pos, self.length))
+        self.marks[idx] = pos
+        self.place_marks()
+        return idx
 
+    def update_endpoints(self):
+        self.start, self.end = self.marks
         return
 
     def play_slice(self, event, snd_engine):
-        chop = self.make_snd(self.snd_array[self.start:self.end, :])
-        snd_engine.mixer.Channel(0).play(chop)
+        snd_engine.channel_play(0, self.preview(self.start, self.end))
 # EOF
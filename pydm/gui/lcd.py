@@ -1,7 +1,11 @@
+from collections import OrderedDict
 from itertools import cycle
 
+import numpy as np
 import pygame
 
+TEXT_CACHE_SIZE = 512 # rendered text Surfaces kept by a TextCache
+
 # =============================================================================
 class Typer:
     '''Typer gets text input from user, and formsts for display'''
@@ -41,13 +45,55 @@ class Typer:
         return
 
 # ============================================================================
+class TextCache:
+    '''LRU cache of rendered text, keyed by (font, text, antialias, colors)
+    The LCD is redrawn every frame with mostly the same text, rendering it is the costly part.
+    The cached Surfaces are shared: blit them, never draw on them
+    '''
+    def __init__(self, size=TEXT_CACHE_SIZE):
+        self.size = size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, font, text, antialias, color, background=None):
+        key = (font, text, bool(antialias), tuple(color), background and tuple(background))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color, background)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.size:
+            self.surfaces.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.0
+        return (
+            f"text cache: {len(self.surfaces)} of {self.size} surfaces | hits {self.hits}, "
+            f"misses {self.misses} ({rate:.1f}% hit rate), evictions {self.evictions}"
+        )
+
+text_cache = TextCache() # shared by all MenuFonts
+
+
 class MenuFont:
-    '''Font object for setting font parameters used in rendering'''
-    def __init__(self, fontsize=20, path=None):
+    '''Font object for setting font parameters used in rendering | render goes through a TextCache'''
+    def __init__(self, fontsize=20, path=None, cache=text_cache):
         self.font = pygame.font.Font(path, fontsize)
         self.width = self.font.size("=")[0]
         self.height = self.font.size("=")[1]
-        self.render = self.font.render
+        self.cache = cache
+
+    def render(self, text, antialias, color, background=None):
+        return self.cache.render(self.font, text, antialias, color, background)
 
 class LCD:
     '''3 parts:
@@ -75,6 +121,7 @@ class LCD:
 
         self.DISPLAY = pygame.Surface((self.WIDTH, self.HEIGHT))
         self.DISPLAY.fill(self.g2)
+        self.shown = None # pixels of DISPLAY last put on screen (see changed_rects)
 
         # --- MSG Overlay | For display error messages or loading/saving messages 
         self.overlay = self.DISPLAY.copy()
@@ -244,6 +291,27 @@ class LCD:
             self.to_display = self.content[start:start+self.nrows]#self.content[start:start*2]
 
     # --------------------------------------------------------------------------
+    def changed_rects(self):
+        '''Rects (in DISPLAY) of the text rows that changed since the last call, one per row
+        Modes redraw the whole DISPLAY every frame, comparing the pixels is cheaper than the screen
+        update it saves (and catches whatever a mode draws)
+        '''
+        pixels = pygame.surfarray.array2d(self.DISPLAY) # [x, y]
+        shown, self.shown = self.shown, pixels
+        if shown is None:
+            return [self.DISPLAY.get_rect()]
+
+        changed = pixels != shown
+        rows = changed.any(axis=0)
+        rects = []
+        for y in range(0, self.HEIGHT, self.font_h):
+            if not rows[y:y+self.font_h].any():
+                continue
+            cols = np.flatnonzero(changed[:, y:y+self.font_h].any(axis=1))
+            h = min(self.font_h, self.HEIGHT - y)
+            rects.append(pygame.Rect(int(cols[0]), y, int(cols[-1] - cols[0]) + 1, h))
+        return rects
+
     def draw_menu_line(self):
         # Draw horizontal line over menu text
         pygame.draw.line(
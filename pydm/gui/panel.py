@@ -86,6 +86,8 @@ class Panel:
 
         knob_rects = [pygame.Rect((125 + x*60, self.fader_levels[12], 30, 35)) for x in range(8)]
         self.fader_knobs = {key: knob_rects[i] for i, key in enumerate(PAD_KEYS)}
+        self.drawn_knobs = {key: rect.copy() for key, rect in self.fader_knobs.items()}
+        self.shown = None # what render last drew (see widgets)
 
         # -- Fader Modes
         self.mixer_modes = itertools.cycle(['volume', 'pitch'])
@@ -111,14 +113,18 @@ class Panel:
     def load_pad_config(self, disk, snd_engine):
         pad_configs = disk.config['pads']
 
+        pads = []
         for pad_config in pad_configs: # Get pad from banks based on config
             bank = pad_config.get('bank')
             ekey = pad_config.get('ekey')
             pad = self.banks[bank][ekey]
 
             pad.from_dict(pad_config) # use pad method to load config
-            missing_snd = snd_engine.set_pitches(pad_config.get('sound_file'))
-            if missing_snd:
+            pads.append(pad)
+
+        missing_snds = snd_engine.set_pad_pitches(pads) # samples are decoded in parallel
+        for pad in pads:
+            if pad.sound_file in missing_snds:
                 pad.sound_file = "None"
         return
 
@@ -170,50 +176,95 @@ class Panel:
 
         return
 
-    def render(self, screen, sequencer):
-        '''Render dynamic elements - Called in main game loop'''
-        state = sequencer.state
-        screen.blit(self.SURFACE, (0, 0))
-
-        # -- Transport
-        pcolor = self.RED if state.playing else self.WHITE
-        pygame.draw.circle(screen, pcolor,  self.led_rects[0].center, 5)
-        pygame.draw.circle(screen, (0, 0, 0), self.led_rects[0].center, 5, 1)
-
-        rcolor = self.RED if state.rec else self.WHITE
-        pygame.draw.circle(screen, rcolor, self.led_rects[1].center, 5)
-        pygame.draw.circle(screen, (0, 0, 0), self.led_rects[1].center, 5, 1)
-
-        # -- FADERS
-        screen.blit(self.mixer_surface, (120, 280))
-
-        for key, rect in self.fader_knobs.items():
-            level = getattr(self.pads[key], self.mixer_mode, 12)
-            self.fader_knobs[key].centery = self.fader_levels[level]
-            screen.blit(self.fader, self.fader_knobs[key])
-
-        if state.met:
-                pygame.draw.rect(screen, self.RED, self.buttons["MET_plus"].inflate(-2,-2))
-                pygame.draw.rect(screen, (0,0,0), self.buttons["MET_plus"], 2)
-        elif not state.met:
-                pygame.draw.rect(screen, self.RED, self.buttons["MET_minus"].inflate(-2,-2))
-                pygame.draw.rect(screen, (0,0,0), self.buttons["MET_minus"], 2)
-
-        # -- Mixer Mode LED
-        for i in [0,1]:
-            color = self.WHITE
-            if (self.mixer_mode == 'volume' and i == 0) or (self.mixer_mode == 'pitch' and i == 1):
-                color = self.RED
-            pygame.draw.circle(screen, color, (70, 372 + i*20), 5)
-            pygame.draw.circle(screen, (0, 0, 0), (70, 372 + i*20), 5, 1)
-
-        # -- Pad Bank LED
-        for i, t in enumerate(["A", "B", "C", "D"]):
-            color = self.WHITE
-            if t == self.bank_name:
-                color = self.RED
-            pygame.draw.circle(screen, color, (70, 495 + i*20), 5)
-            pygame.draw.circle(screen, (0,0,0), (70, 495 + i*20), 5, 1)
-
+    # -------------------------------------------------------------------------
+    def widgets(self, state):
+        '''Dynamic elements: name -> what they show, drawn again only when that changes'''
+        shown = {
+            'play': state.playing,
+            'rec': state.rec,
+            'met': state.met,
+            'mixer_led': self.mixer_mode,
+            'bank_led': self.bank_name,
+            'vol': self.vol_knob.index,
+        }
+        for key in PAD_KEYS:
+            shown[key] = getattr(self.pads[key], self.mixer_mode, 12)
+        return shown
+
+    def widget_rect(self, name):
+        '''Screen area of a dynamic element (faders: from where it was drawn to where it is now)'''
+        if name == 'play' or name == 'rec':
+            led = self.led_rects[0 if name == 'play' else 1]
+            return pygame.Rect(led.centerx-6, led.centery-6, 12, 12)
+        elif name == 'met':
+            return self.buttons["MET_plus"].union(self.buttons["MET_minus"])
+        elif name == 'mixer_led':
+            return pygame.Rect(64, 366, 12, 32)
+        elif name == 'bank_led':
+            return pygame.Rect(64, 489, 12, 72)
+        elif name == 'vol':
+            return self.vol_knob.rect.inflate(4, 4)
+        return self.drawn_knobs[name].union(self.fader_knobs[name])
+
+    def draw_widget(self, screen, name, shown):
+        if name == 'play' or name == 'rec':
+            led = self.led_rects[0 if name == 'play' else 1]
+            color = self.RED if shown[name] else self.WHITE
+            pygame.draw.circle(screen, color, led.center, 5)
+            pygame.draw.circle(screen, (0, 0, 0), led.center, 5, 1)
+
+        elif name == 'met':
+            button = self.buttons["MET_plus"] if shown['met'] else self.buttons["MET_minus"]
+            pygame.draw.rect(screen, self.RED, button.inflate(-2,-2))
+            pygame.draw.rect(screen, (0,0,0), button, 2)
+
+        elif name == 'mixer_led':
+            for i, mode in enumerate(['volume', 'pitch']):
+                color = self.RED if shown['mixer_led'] == mode else self.WHITE
+                pygame.draw.circle(screen, color, (70, 372 + i*20), 5)
+                pygame.draw.circle(screen, (0, 0, 0), (70, 372 + i*20), 5, 1)
+
+        elif name == 'bank_led':
+            for i, t in enumerate(["A", "B", "C", "D"]):
+                color = self.RED if t == shown['bank_led'] else self.WHITE
+                pygame.draw.circle(screen, color, (70, 495 + i*20), 5)
+                pygame.draw.circle(screen, (0,0,0), (70, 495 + i*20), 5, 1)
+
+        elif name in self.fader_knobs:
+            self.fader_knobs[name].centery = self.fader_levels[shown[name]]
+            screen.blit(self.fader, self.fader_knobs[name])
+            self.drawn_knobs[name] = self.fader_knobs[name].copy()
+        # 'vol': the knob draws itself on SURFACE (VolumeKnob.update)
         return
+
+    def render(self, screen, sequencer, full=False):
+        '''Render dynamic elements - Called in main game loop
+        Only elements that changed since the last call are drawn (over the static SURFACE under them),
+        returns the screen rects that changed, for pygame.display.update. full: draw everything
+        '''
+        shown = self.widgets(sequencer.state)
+        if full or self.shown is None:
+            screen.blit(self.SURFACE, (0, 0))
+            screen.blit(self.mixer_surface, (120, 280))
+            for name in shown:
+                self.draw_widget(screen, name, shown)
+            self.shown = shown
+            return [screen.get_rect()]
+
+        rects = []
+        for name, value in shown.items():
+            if value == self.shown[name]:
+                continue
+            if name in self.fader_knobs: # fader_motion may have moved the knob already
+                self.fader_knobs[name].centery = self.fader_levels[value]
+            rect = self.widget_rect(name)
+            screen.set_clip(rect) # static panel under the element, mixer included
+            screen.blit(self.SURFACE, (0, 0))
+            screen.blit(self.mixer_surface, (120, 280))
+            self.draw_widget(screen, name, shown)
+            screen.set_clip(None)
+            rects.append(rect)
+
+        self.shown = shown
+        return rects
 # EOF
@@ -0,0 +1,83 @@
+'''Frame timing overlay, toggled with F3
+frame: time between drawn frames | render: mode update + render + display update of a frame |
+poll: time between two sequencer polls (has to stay well under Sequencer.lookahead or notes are late)
+'''
+from collections import deque
+
+import pygame
+
+STATS_KEY = pygame.K_F3
+
+
+class FrameStats:
+    WINDOW = 120 # latest frames (and 4x as many polls) averaged
+    WHITE = (255,255,255)
+
+    def __init__(self, font):
+        self.font = font
+        self.visible = False
+        self.frames = deque(maxlen=self.WINDOW)
+        self.renders = deque(maxlen=self.WINDOW)
+        self.polls = deque(maxlen=4*self.WINDOW)
+        self.last_frame = None
+        self.last_poll = None
+        self.drawn = 0
+        self.skipped = 0 # frames due with nothing to draw
+
+        self.rect = pygame.Rect(0, 0, 250, 3*font.get_linesize() + 8)
+        self.surface = pygame.Surface(self.rect.size)
+
+    def toggle(self):
+        self.visible = not self.visible
+        return
+
+    def poll(self, now):
+        if self.last_poll is not None:
+            self.polls.append(now - self.last_poll)
+        self.last_poll = now
+        return
+
+    def frame(self, start, end):
+        '''A frame was drawn from start to end (perf_counter times)'''
+        if self.last_frame is not None:
+            self.frames.append(start - self.last_frame)
+        self.last_frame = start
+        self.renders.append(end - start)
+        self.drawn += 1
+        return
+
+    def skip(self):
+        self.skipped += 1
+        return
+
+    @staticmethod
+    def ms(times):
+        '''(mean, max) in ms'''
+        if not times:
+            return 0.0, 0.0
+        return 1000 * sum(times) / len(times), 1000 * max(times)
+
+    def lines(self):
+        frame, _ = self.ms(self.frames)
+        fps = 1000 / frame if frame else 0.0
+        render, render_max = self.ms(self.renders)
+        poll, poll_max = self.ms(self.polls)
+        return [
+            f"frame {frame:.1f} ms ({fps:.0f} fps) | skipped {self.skipped}",
+            f"render {render:.2f} ms, max {render_max:.2f} ms",
+            f"poll {poll:.2f} ms, max {poll_max:.2f} ms",
+        ]
+
+    def draw(self, screen):
+        '''Draw the overlay (top left of the window) | returns its rect'''
+        self.surface.fill((0,0,0))
+        y = 4
+        for line in self.lines():
+            self.surface.blit(self.font.render(line, True, self.WHITE), (6, y))
+            y += self.font.get_linesize()
+        return screen.blit(self.surface, self.rect)
+
+    def report(self):
+        return f"frames: {self.drawn} drawn, {self.skipped} skipped | " + " | ".join(self.lines()[1:])
+
+# EOF
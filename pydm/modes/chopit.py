@@ -5,7 +5,8 @@ from pygame.locals import *
 
 from pydm.modes.mode import Mode, Default, Command
 from pydm.gui.lcd import Typer
-from pydm.gui.editors import Chopper, write_wave
+from pydm.gui.editors import Chopper, write_waves
+from pydm.core.onsets import find_onsets, SENSITIVITY
 
 from pydm.modes import Perform
 
@@ -15,8 +16,10 @@ close_menu = Command(None, 'make_menu', 'main')
 cmds = {
     'main': {
         'softkey_1': Command(None, 'remove_slice'),
+        'softkey_2': Command(None, 'auto_chop'),
         'softkey_3': Command(None, 'make_menu', 'to_pads'), #Default(),
         'softkey_4': Command(None, 'make_menu', 'to_mem'),
+        'softkey_5': Command(None, 'change_sens'),
         'softkey_6': Command('dm', 'change_mode', 'main')
     },
     'to_pads': {
@@ -33,7 +36,7 @@ cmds = {
 }
 # ------ LCD ------ #
 headers = {
-    'main': {0: {0: "SLICE:", 1: "START-LOC:"}},
+    'main': {0: {0: "SLICE:", 1: "START-LOC:", 2: "SENS:", 3: "ZOOM:"}},
     'to_pads': {0: {0: ''}},
     'to_mem': {0: {0: ''}}
 }
@@ -43,7 +46,7 @@ typing = ["Typing..."]
 use_name = ["<EXIT>", "<CONFIRM>"]
 
 footers = {
-    'main': ["<DEL>", "", "<TO-PADS>", "<TO-MEM>", "", "<EXIT>"],
+    'main': ["<DEL>", "<AUTO>", "<TO-PADS>", "<TO-MEM>", "<SENS>", "<EXIT>"],
     'to_pads': ['<A>', '<B>', '<C>', '<D>', '<>', '<CANCEL>'],
     'to_mem': use_name,
     'typing': typing
@@ -60,16 +63,18 @@ class Chop(Mode):
         if from_memory:
             snd_path = self.snd_engine.sounds[sound_name]['path']
             snd_array = pygame.sndarray.array(self.snd_engine.mixer.Sound(snd_path))
+            peaks = self.snd_engine.peaks(sound_name, snd_array)
         else:
             snd_array = pygame.sndarray.array(self.snd_engine.mixer.Sound(sound_name))
+            peaks = None
 
-        self.chopper = Chopper(self.lcd, snd_array) # Check snd here, if len == 0 msg and exit
+        self.chopper = Chopper(self.lcd, snd_array, peaks) # Check snd here, if len == 0 msg and exit
 
         self.selected_bank = None
         self.sound_name = sound_name
         self.drag = False
-        self.drag_rect = None
         self.slice_idx = None
+        self.sensitivity = 5 # auto chop, 1-10 (10 finds the most hits)
         self.make_menu('main')
 
     # --------------------------------------------------------------------------
@@ -93,7 +98,11 @@ class Chop(Mode):
     # --------------------------------------------------------------------------
     def events(self, event):
         '''Mode Event Handler'''
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+        if self.job is not None: # only CANCEL until the job is over
+            if event.type == pygame.KEYDOWN:
+                self.handle_input(event)
+
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self.panel.handle_click(self)
 
             mx, my = pygame.mouse.get_pos()
@@ -104,21 +113,15 @@ class Chop(Mode):
             # Translate actual to y=0, x adjusted by lcd offset
             if lcd_rect.colliderect(mouse_actual):
                 mx -= self.lcd.offset #100 #offset
-                mouse_rect = pygame.Rect((mx, 0),(1,1))
-                collide = mouse_rect.collidelistall(self.chopper.rects)
+                idx = self.chopper.mark_at(mx)
+                if idx is None:
+                    idx = self.chopper.make_slice(mx)
+                    if idx is not None:
+                        self.chopper.update_slices()
 
-                if collide:
+                if idx is not None:
                     self.drag = True
-                    self.slice_idx = collide[0]
-                    self.drag_rect = self.chopper.rects[self.slice_idx]
-                else:
-                    self.chopper.make_slice()
-                    collide = mouse_rect.collidelistall(self.chopper.rects)
-
-                    if collide:
-                        self.drag = True
-                        self.slice_idx = collide[0]
-                        self.drag_rect = self.chopper.rects[self.slice_idx]
+                    self.slice_idx = idx
 
         elif event.type == pygame.MOUSEMOTION and self.drag:
             self.chop_motion()
@@ -126,7 +129,9 @@ class Chop(Mode):
         elif event.type == MOUSEBUTTONUP and event.button == 1 and self.drag:
             self.drag = False
             self.chopper.update_slices()
-            self.slice_idx = self.chopper.rects.index(self.drag_rect) # works
+
+        elif self.menu == 'main' and self.chopper.view_event(event, self.mouse_x()):
+            pass # zoomed/scrolled
 
         elif self.typer != None:
             self.typer.typer_event(event)
@@ -141,9 +146,8 @@ class Chop(Mode):
                     self.handle_input(event)
 
         elif event.type == pygame.KEYDOWN:
-            if (event.key == K_LEFT or event.key == K_RIGHT) and self.drag_rect:
+            if (event.key == K_LEFT or event.key == K_RIGHT) and self.slice_idx is not None:
                 self.chop_tune(event.key)
-                self.slice_idx = self.chopper.rects.index(self.drag_rect)
 
             elif event.key in self.pad_keys:
                 self.chopper.play_slice(event, self.snd_engine)
@@ -175,7 +179,7 @@ class Chop(Mode):
                 end = None
                 slice = self.slice_idx
 
-            vals = [f"{slice}", f"{end}"] #
+            vals = [f"{slice}", f"{end}", f"{self.sensitivity}", f"{self.chopper.zoom_level:.1f}x"] #
             content = [lcd.make_text(loc, text, (0,0,0))for loc, text in zip(lcd.v_coords, vals)]
             to_blit = [lcd.keys, lcd.menu, content]
             lcd.DISPLAY.blit(self.chopper.wav_surface, (0, lcd.font.height*2))
@@ -186,52 +190,46 @@ class Chop(Mode):
         self.lcd.draw_menu_line()
         if header_line:
             self.lcd.draw_header_line()
+        self.job_update()
         return
 
     # --------------------------------------------------------------------------
     '''METHODS'''
     def remove_slice(self):
-        # pop line and rect
         if self.slice_idx != None:
-            self.chopper.rects.pop(self.slice_idx)
-            self.chopper.edit_lines.pop(self.slice_idx)
+            self.chopper.remove_mark(self.slice_idx)
             self.slice_idx = None
             self.drag = False
-            self.drag_rect = None
-            self.chopper.update_slices()
         return
 
     def chop_tune(self, ekey):
+        '''Nudge the selected slice point by a pixel (of the current zoom, so down to a single frame)'''
+        step = self.chopper.frames_per_pixel()
         if ekey == K_LEFT:
-            self.drag_rect.x -=1
-        elif ekey == K_RIGHT:
-            self.drag_rect.x +=1
-
-        x = self.drag_rect.centerx # DRY
-        if x < 0:
-            x = 1
-        elif x > self.lcd.WIDTH:
-            x = self.lcd.WIDTH-1
-
-        self.drag_rect.centerx = x # fixes flag off screen, but if sample len == 0, div by zero
-        self.chopper.edit_lines[self.slice_idx] = [(x, self.lcd.HEIGHT), (x, 0)]
+            step = -step
+        pos = self.chopper.marks[self.slice_idx] + step
+        self.slice_idx = self.chopper.move_mark(self.slice_idx, pos)
         self.chopper.update_slices()
         return
 
     def chop_motion(self):
-        mx, my = pygame.mouse.get_pos()
-        mx -= self.lcd.offset #100
-
-        # Clamp to LCD Width [DRY - used elsewhere...]
-        if mx < 0:
-            x = 1
-        elif mx > self.lcd.WIDTH:
-            x = self.lcd.WIDTH-1
-        else:
-            x = mx
-        self.drag_rect.centerx = x
-        self.chopper.edit_lines[self.slice_idx] = [(x, self.lcd.HEIGHT), (x, 0)]
+        pos = self.chopper.pos_of(self.mouse_x())
+        self.slice_idx = self.chopper.move_mark(self.slice_idx, pos)
+        return
 
+    def auto_chop(self):
+        '''Slice at the strongest hits of the sound (as many as there are pads)'''
+        points = find_onsets(self.chopper.snd_array, self.sensitivity, limit=self.chopper.MAX_MARKS)
+        if not points:
+            self.msg_popup("No hits found, try a higher SENS")
+            return
+        self.chopper.set_marks(points)
+        self.slice_idx = None
+        self.drag = False
+        return
+
+    def change_sens(self):
+        self.sensitivity = self.sensitivity % max(SENSITIVITY) + 1 # 1-10, then back to 1
         return
 
     def set_bank(self, bank):
@@ -243,20 +241,25 @@ class Chop(Mode):
         if len(name) == 0:
             return
 
-        chops_objs = self.chopper.chop_play # these are pygame Sound objects
-        # sound arrays / numpy arrys
-        chops = {key: pygame.sndarray.array(chop) for key, chop in chops_objs.items()}
+        chops = self.chopper.chop_arrays() # sound arrays / numpy arrys
 
-        i = 0
-        for key, chop in chops.items():
+        files = []
+        self.chop_names = {}
+        for i, (key, chop) in enumerate(chops.items()):
             new_name = f"{name}-{str(i)}.wav"
 
             if new_name in list(self.snd_engine.sounds.keys()):
                 new_name = "pydm_" + new_name
             temp_dir = self.dm.disk.sound_dir
             path = temp_dir / new_name
-            write_wave(path, chop)
+            files.append((path, chop))
+            self.chop_names[key] = new_name
+
+        self.start_job("Saving", write_waves(files), self.chops_written)
+        return
 
+    def chops_written(self, paths):
+        for path, (key, new_name) in zip(paths, self.chop_names.items()):
             # add sound to engine, with path used during write
             self.snd_engine.load_sound(path)
 
@@ -264,7 +267,6 @@ class Chop(Mode):
                 pad = self.panel.banks[self.selected_bank][key]
                 pad.sound_file = new_name
                 self.snd_engine.set_pitches(new_name)
-            i += 1
 
         self.dm.change_mode("main")
         return
@@ -7,8 +7,9 @@ from pygame.locals import *
 
 from pydm.modes.mode import Mode, Default, Command
 from pydm.gui.lcd import Typer
-from pydm.gui.editors import Truncator, write_wave
-from pydm.core.snd_engine import moog_filter
+from pydm.gui.editors import Truncator, write_waves
+from pydm.core.snd_engine import moog_filter_job
+from pydm.core.history import EditHistory, UNDO_BUDGET
 
 # ------ Commands ------ #
 close_menu = Command(None, 'make_menu', 'main')
@@ -17,8 +18,8 @@ cmds = {
     'main': {
         'softkey_1': Command(None, 'make_menu', 'to_mem'),
         'softkey_2': Command(None, 'undo'),
-        'softkey_3': Command(None, 'reverse_snd'),
-        'softkey_4': Command(None, 'filter_snd'),
+        'softkey_3': Command(None, 'redo'),
+        'softkey_4': Command(None, 'make_menu', 'fx'),
         'softkey_5': Command(None, 'truncate'),
         'softkey_6': Command('dm', 'change_mode', 'main'),
         "idx-": Command(None, 'chop_tune', K_LEFT),
@@ -27,12 +28,38 @@ cmds = {
     'to_mem': {
         'softkey_1': close_menu,
         'softkey_2': Command(None, 'write_chops'),
+    },
+    'fx': {
+        'softkey_1': Command(None, 'reverse_snd'),
+        'softkey_2': Command(None, 'make_menu', 'filter'),
+        'softkey_6': close_menu
+    },
+    'filter': {
+        'softkey_1': Command(None, 'change_filter', -1),
+        'softkey_2': Command(None, 'change_filter', 1),
+        'softkey_4': Command(None, 'filter_snd'),
+        'softkey_6': close_menu,
+        "idx-": Command(None, 'select_filter', -1),
+        "idx+": Command(None, 'select_filter', 1)
     }
 }
+
+# ------ Filter settings | values each parameter steps through (defaults are the old fixed values)
+filter_values = {
+    'cutoff': [50, 80, 120, 180, 250, 350, 500, 750, 1000, 1500, 2200, 3300, 5000, 7500, 10000],
+    'resonance': [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9],
+    'drive': [0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0],
+}
+filter_defaults = {'cutoff': 250, 'resonance': 0.1, 'drive': 1.0}
 # ------ LCD ------ #
 headers = {
-    'main':  {0: {0:"START: ", 1:"END: ", 3: "UNDOS: "}},
-    'to_mem': {0: {0: ''}}
+    'main':  {0: {0:"START: ", 1:"END: ", 2:"ZOOM: ", 3: "UNDOS: "}, 1: {3: "REDOS: "}},
+    'fx':  {0: {0:"START: ", 1:"END: ", 2:"ZOOM: ", 3: "UNDOS: "}, 1: {3: "REDOS: "}},
+    'to_mem': {0: {0: ''}},
+    'filter': {
+        0: {0:"START: ", 1:"END: ", 2:"ZOOM: ", 3: "UNDOS: "},
+        1: {0:"CUTOFF: ", 1:"RES: ", 2:"DRIVE: ", 3: "REDOS: "}
+    }
 }
 
 confirm = ["<NO>", "<YES>"]
@@ -40,14 +67,16 @@ typing = ["Typing..."]
 use_name = ["<EXIT>", "<CONFIRM>"]
 
 footers = {
-    'main': ["<SAVE>", "<UNDO>", "<REVERSE>", "<FILTER>", "<TRUNCATE>", "<EXIT>"],
+    'main': ["<SAVE>", "<UNDO>", "<REDO>", "<FX>", "<TRUNCATE>", "<EXIT>"],
+    'fx': ["<REVERSE>", "<FILTER>", "", "", "", "<BACK>"],
     'to_mem': use_name,
+    'filter': ["<VAL->", "<VAL+>", "", "<APPLY>", "", "<BACK>"],
     'typing': typing
 }
 
 # ==============================================================================
 class Edit(Mode):
-    def __init__(self, dm, sound_name):
+    def __init__(self, dm, sound_name, undo_budget=UNDO_BUDGET):
         super().__init__(dm)
         self.name = 'edit'
         self.header_dict = headers
@@ -56,7 +85,9 @@ class Edit(Mode):
         snd_path = self.snd_engine.sounds[sound_name]['path']
         snd_array = pygame.sndarray.array(self.snd_engine.mixer.Sound(snd_path))
 
-        self.editor = Truncator(self.lcd, snd_array)
+        # Edits are made in place, the history keeps what is needed to undo/redo them
+        self.history = EditHistory(snd_array, undo_budget)
+        self.editor = Truncator(self.lcd, self.history.sound, self.snd_engine.peaks(sound_name, snd_array))
 
         self.shade_surface = self.editor.wav_surface.copy()
         self.shade_surface.fill((80, 80, 0))
@@ -64,10 +95,10 @@ class Edit(Mode):
         self.shade_rect = self.shade_surface.get_rect()
 
         self.sound_name = sound_name
-        self.edit_stack = []
         self.drag = False
-        self.drag_rect = None
         self.slice_idx = None
+        self.filter_param = 'cutoff' # selected with up/down in the filter menu
+        self.filter_idx = {key: filter_values[key].index(val) for key, val in filter_defaults.items()}
         self.make_menu('main')
 
     # --------------------------------------------------------------------------
@@ -89,7 +120,11 @@ class Edit(Mode):
     # --------------------------------------------------------------------------
     def events(self, event):
         '''Mode Event Handler'''
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+        if self.job is not None: # only CANCEL until the job is over
+            if event.type == pygame.KEYDOWN:
+                self.handle_input(event)
+
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self.panel.handle_click(self)
 
             mx, my = pygame.mouse.get_pos()
@@ -98,13 +133,10 @@ class Edit(Mode):
             # check if inside LCD here
             if lcd_rect.colliderect(mouse_actual):
                 mx -= self.lcd.offset #100 #offset
-                my = 0
-                mouse_rect = pygame.Rect((mx,my),(1,1))
-                collide = mouse_rect.collidelistall(self.editor.rects)
-                if collide:
+                idx = self.editor.mark_at(mx)
+                if idx is not None:
                     self.drag = True
-                    self.slice_idx = collide[0]
-                    self.drag_rect = self.editor.rects[self.slice_idx]
+                    self.slice_idx = idx
 
         elif event.type == pygame.MOUSEMOTION and self.drag: # add bound/clamp
             self.chop_motion()
@@ -113,6 +145,9 @@ class Edit(Mode):
             self.drag = False
             self.editor.update_endpoints()
 
+        elif self.menu != 'to_mem' and self.editor.view_event(event, self.mouse_x()):
+            pass # zoomed/scrolled
+
         elif self.typer != None:
             self.typer.typer_event(event)
             if self.typer.active:
@@ -124,7 +159,7 @@ class Edit(Mode):
                     self.handle_input(event)
 
         elif event.type == pygame.KEYDOWN:
-            if (event.key == K_LEFT or event.key == K_RIGHT) and self.drag_rect: #selected_rect
+            if (event.key == K_LEFT or event.key == K_RIGHT) and self.slice_idx is not None:
                 self.chop_tune(event.key)
             elif event.key in self.pad_keys:
                 self.editor.play_slice(event, self.snd_engine)
@@ -138,7 +173,7 @@ class Edit(Mode):
         lcd = self.lcd
         self.lcd.DISPLAY.fill(self.lcd.g2)
 
-        if self.menu != 'main':
+        if self.menu == 'to_mem':
             to_blit, header_line = self.typer_update(
                 name_type="File",
                 check=list(self.snd_engine.sounds.keys()),
@@ -148,18 +183,26 @@ class Edit(Mode):
             header_line = True
             self.editor.draw_editor(self.slice_idx)
 
-            vals = [f"{self.editor.start}", f"{self.editor.end}", f"{len(self.edit_stack)}"] #
+            zoom = f"{self.editor.zoom_level:.1f}x"
+            vals = [f"{self.editor.start}", f"{self.editor.end}", zoom, f"{len(self.history.undos)}"] #
+            if self.menu == 'filter':
+                for key in filter_values:
+                    mark = ">" if key == self.filter_param else ""
+                    vals.append(f"{mark}{self.filter_setting(key)}")
+            vals.append(f"{len(self.history.redos)}")
             content = [lcd.make_text(loc, text, (0,0,0))for loc, text in zip(lcd.v_coords, vals)]
 
             to_blit = [lcd.keys, lcd.menu, content]
 
+            # the lines can be out of view when zoomed in
+            start_x, end_x = [max(0, min(self.lcd.WIDTH, line[0][0])) for line in self.editor.edit_lines]
             area_rect = self.shade_rect.copy()
-            area_rect.width = self.editor.edit_lines[0][0][0]
+            area_rect.width = start_x
             self.editor.wav_surface.blit(self.shade_surface, self.shade_rect, area_rect)
 
             # offset | 600
-            area_rect.width = self.lcd.WIDTH-self.editor.edit_lines[1][0][0] #self.editor.rects[1].left
-            area_rect.x = self.editor.edit_lines[1][0][0]
+            area_rect.width = self.lcd.WIDTH-end_x #self.editor.rects[1].left
+            area_rect.x = end_x
             self.editor.wav_surface.blit(self.shade_surface, area_rect, area_rect)
             self.lcd.DISPLAY.blit(self.editor.wav_surface, (0,self.lcd.font.height*2))
 
@@ -169,57 +212,38 @@ class Edit(Mode):
         if header_line:
             lcd.draw_header_line()
         lcd.draw_menu_line()
+        self.job_update()
 
         return
 
     # --------------------------------------------------------------------------
     '''METHODS'''
-    # Need to bound moving the endpoints
     def chop_tune(self, ekey):
+        '''Nudge the selected marker by a pixel (of the current zoom, so down to a single frame)'''
+        if self.slice_idx is None:
+            return
+        step = self.editor.frames_per_pixel()
         if ekey == K_LEFT:
-            self.drag_rect.x -=1
-        elif ekey == K_RIGHT:
-            self.drag_rect.x +=1
-
-        self.check_endpoints()
+            step = -step
+        self.editor.move_mark(self.slice_idx, self.editor.marks[self.slice_idx] + step)
         self.editor.update_endpoints()
         return
 
     def chop_motion(self):
-        mx, my = pygame.mouse.get_pos()
-        mx -= self.lcd.offset #100 #offset
-        my = 0
-        self.drag_rect.centerx = mx
-        self.check_endpoints()
+        self.editor.move_mark(self.slice_idx, self.editor.pos_of(self.mouse_x()))
         return
 
-    def check_endpoints(self):
-        x = self.drag_rect.centerx
-        # Clamp to LCD Width
-        if x < 0:
-            x = 0
-        if x > self.lcd.WIDTH:
-            x = self.lcd.WIDTH-1
-
-        if self.slice_idx == 0:
-            if self.editor.rects[0].right > self.editor.rects[1].left:
-                self.editor.rects[0].right = self.editor.rects[1].left
-                x = self.editor.rects[0].centerx
-        elif self.slice_idx == 1:
-            if self.editor.rects[1].left < self.editor.rects[0].right:
-                self.editor.rects[1].left = self.editor.rects[0].right
-                x = self.editor.rects[1].centerx
-
-        self.drag_rect.centerx = x
-        self.editor.edit_lines[self.slice_idx] = [(x, self.lcd.HEIGHT), (x, 0)]
+    def reverse_snd(self):
+        self.history.reverse()
+        self.update_snd()
         return
 
-    def reverse_snd(self):
-        self.msg_popup("Processing...")
-        self.edit_stack.append(self.editor.snd_array.copy())
-        self.editor.snd_array = np.ascontiguousarray(self.editor.snd_array[::-1, :])
+    def update_snd(self, reset=True):
+        '''Show the sound after an edit, undo or redo'''
+        self.editor.snd_array = self.history.sound
         self.editor.remake_waveform()
-        self.editor.init_endpoints()
+        if reset:
+            self.editor.init_endpoints()
         return
 
     def write_chops(self):
@@ -235,60 +259,59 @@ class Edit(Mode):
         end = self.editor.end
         temp_dir = self.dm.disk.sound_dir
         path = temp_dir / name
-        write_wave(path, self.editor.snd_array[start:end, :])
+        work = write_waves([(path, self.editor.snd_array[start:end, :])])
+        self.start_job("Saving", work, self.chops_written)
+        return
 
-        self.snd_engine.load_sound(path) # add sound to engine, with path used during write
+    def chops_written(self, paths):
+        for path in paths:
+            self.snd_engine.load_sound(path) # add sound to engine, with path used during write
         self.dm.change_mode("main") #exit chop mode...
-
         return
 
     def undo(self):
-        self.msg_popup("Processing...")
-        if len(self.edit_stack) != 0:
-            snd_arry = self.edit_stack.pop()
-            self.editor.snd_array = snd_arry.copy()
-            self.editor.remake_waveform()
-            self.editor.init_endpoints()
+        if self.history.undo():
+            self.update_snd()
         return
 
-    def truncate(self):
-        self.msg_popup("Processing...")
-        start = self.editor.start
-        end = self.editor.end
+    def redo(self):
+        if self.history.redo():
+            self.update_snd()
+        return
 
-        self.edit_stack.append(self.editor.snd_array.copy())
-        self.editor.snd_array = self.editor.snd_array[start:end, :].copy()
-        self.editor.remake_waveform()
-        self.editor.init_endpoints()
+    def truncate(self):
+        self.history.truncate(self.editor.start, self.editor.end)
+        self.update_snd()
         return
 
-    def filter_snd(self):
-        self.edit_stack.append(self.editor.snd_array.copy())
-        data = self.editor.snd_array.copy()
-
-        # Seperate left and right channels for processing
-        self.msg_popup("Processing...")
-        channels = []
-        if data.shape[1] == 2:
-            yL = data[:, 0].copy() / 2 ** 15
-            yR = data[:, 1].copy() / 2 ** 15
-            channels.append(yL)
-            channels.append(yR)
-        else:
-            yL = data[:, 0].copy() / 2 ** 15
-            channels.append(yL)
+    def filter_setting(self, key):
+        return filter_values[key][self.filter_idx[key]]
 
-        output = []
-        for channel in channels:
-            filt_data = moog_filter(channel)
-            output.append(filt_data)
+    def select_filter(self, val):
+        keys = list(filter_values)
+        idx = keys.index(self.filter_param) + val
+        self.filter_param = keys[max(0, min(len(keys)-1, idx))]
+        return
 
-        if len(output) == 2:
-            results = np.vstack([output[0], output[1]]).T
-        else:
-            results = output[0]
+    def change_filter(self, val):
+        idx = self.filter_idx[self.filter_param] + val
+        self.filter_idx[self.filter_param] = max(0, min(len(filter_values[self.filter_param])-1, idx))
+        return
+
+    def filter_snd(self):
+        # All channels are filtered in one pass (each keeps its own filter state)
+        work = moog_filter_job(
+            self.editor.snd_array / 2 ** 15,
+            cutoff=self.filter_setting('cutoff'),
+            resonance=self.filter_setting('resonance'),
+            drive=self.filter_setting('drive')
+        )
+        self.start_job("Filtering", work, self.filtered, 'main')
+        return
 
-        self.editor.snd_array = np.ascontiguousarray(results)
+    def filtered(self, snd_array):
+        self.history.replace(snd_array)
+        self.update_snd(reset=False)
         return
 
 
@@ -72,6 +72,7 @@ cursor_cmds = {
 confirm_footer = ["<NO>", "<YES>"]
 use_name_footer = ["<EXIT>", "<CONFIRM>"]
 typing_footer = ["Typing..."]
+job_footer = ["", "", "", "", "", "<CANCEL>"]
 
 
 # ==============================================================================
@@ -96,6 +97,7 @@ class Mode:
         self.commands = {}
         self.menu = None
         self.typer = None
+        self.job = None # background edit in progress (see start_job)
         self.lcd.cursor_idx = 0
 
     def msg_popup(self, msg="Loading...", error=False):
@@ -114,6 +116,7 @@ class Mode:
         self.lcd.DISPLAY.blit(self.lcd.overlay, (0,0))
         self.dm.screen.blit(self.lcd.DISPLAY, self.lcd.blitloc)
         pygame.display.flip()
+        self.dm.redraw = True # drawn behind render's back
 
         if error:
             time.sleep(2)
@@ -122,6 +125,62 @@ class Mode:
 
         return
 
+    def mouse_x(self):
+        '''Mouse x in LCD coordinates (for the waveform editors)'''
+        return pygame.mouse.get_pos()[0] - self.lcd.offset
+
+    # --------------------------------------------------------------------------
+    def start_job(self, name, work, on_done, menu=None):
+        '''Run work (see pydm.core.jobs) on the job thread, on_done gets its result between two frames
+        Until it finishes the only softkey is CANCEL and update draws its progress (see job_update)
+        menu: menu to show when the job is over, default the current one
+        '''
+        self.job = self.dm.jobs.submit(name, work, on_done)
+        self.job_menu = menu or self.menu
+        self.commands = {'softkey_6': Command(None, 'cancel_job')}
+        self.lcd.make_footer(job_footer)
+        return
+
+    def cancel_job(self):
+        if self.job is not None:
+            self.job.cancel()
+        return
+
+    def job_update(self):
+        '''Call at the end of update: draws the progress of a running job, and puts the menu
+        back once its result is in (JobQueue.poll ran on_done) | returns True until then
+        '''
+        job = self.job
+        if job is None:
+            return False
+        if job.delivered:
+            self.job = None
+            if job.state == 'failed':
+                self.msg_popup(f"{job.name} failed", error=True)
+            self.make_menu(self.job_menu)
+            return False
+
+        lcd = self.lcd
+        w, h = lcd.msg_rect.size
+        lcd.msg_surf.fill(lcd.g2)
+        pygame.draw.rect(lcd.msg_surf, (0,0,0), (0,0,w,h), 5)
+
+        text = f"{job.name}... {int(100 * job.progress)}%"
+        if job.cancelled.is_set():
+            text = "Cancelling..."
+        dialog_text, dialog_rect = lcd.make_text((0, 0), text, (0,0,0), menu=False)
+        dialog_rect.center = (w//2, h//3)
+        lcd.msg_surf.blit(dialog_text, dialog_rect)
+
+        bar = pygame.Rect(20, 2*h//3 - 8, w - 40, 16)
+        pygame.draw.rect(lcd.msg_surf, (0,0,0), bar, 2)
+        bar.width = int(bar.width * job.progress)
+        pygame.draw.rect(lcd.msg_surf, (0,0,0), bar)
+
+        lcd.DISPLAY.blit(lcd.overlay, (0,0))
+        lcd.DISPLAY.blit(lcd.msg_surf, lcd.msg_rect)
+        return True
+
     def typer_update(self, texta="", textb="", name_type="File", check=None, check_text='', prompt=False):
         """Updates displayed text when user is prompted to type sound, song, and other names
         
@@ -212,8 +271,14 @@ class Mode:
 
         return
 
+    def poll(self):
+        '''Called every pass of the main loop (far more often than update): time critical work only,
+        i.e. playing the sequence | override in sub-class if needed
+        '''
+        pass
+
     def update(self):
-        '''This method need to be overridden in sub-class: handle update logic'''
+        '''This method need to be overridden in sub-class: handle update logic (once per drawn frame)'''
         pass
 
 # EOF
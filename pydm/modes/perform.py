@@ -1,3 +1,4 @@
+import numpy as np
 import pygame
 from pygame.locals import *
 
@@ -16,7 +17,7 @@ sequencer_cmds = {
     "AC_plus": Command('sequencer', 'set_tc', 1),
     "MET_minus": Command('sequencer', 'toggle_met'),
     "MET_plus": Command('sequencer', 'toggle_met'),
-    "play": Command('sequencer', 'toggle_play'),
+    "play": Command(None, 'toggle_play'),
     "record": Command('sequencer', 'toggle_rec'),
     "delete": Command('sequencer', 'toggle_delete'),
     "mixer_toggle": Command('panel', 'toggle_mixer'),
@@ -97,6 +98,8 @@ class Perform(Mode):
         self.grid_rects = factory.make_grid_rects(self)
         self.grid = self.grid_rects[self.sequencer.ac]
         self.fill_rects = []
+        self.fill_cache = {} # (seq, bar, bank, quantize): fill_rects | only valid for fill_edits
+        self.fill_edits = None
 
         self.grid_text = factory.make_pad_letters(self.lcd) #do sound name | update
         self.grid_text.extend(factory.make_grid_beats(self.lcd))
@@ -161,18 +164,17 @@ class Perform(Mode):
 
     # --------------------------------------------------------------------------
     '''UPDATEs'''
-    def update(self):
+    def poll(self):
         if self.sequencer.error is True:
             self.snd_engine.play_error()
             self.sequencer.error = False
 
-        check_seq, play_met = self.sequencer.update()
-        if play_met:
-            self.snd_engine.play_met(self.sequencer.beat)
-
-        if check_seq:
-            self.snd_engine.sequncer_play(self.sequencer, self.panel.banks)
+        ticks = self.sequencer.update()
+        if ticks:
+            self.snd_engine.sequncer_play(ticks, self.panel.banks, met=True)
+        return
 
+    def update(self):
         self.lcd_update()
         return
 
@@ -213,6 +215,12 @@ class Perform(Mode):
 
     # --------------------------------------------------------------------------
     '''Methods'''
+    def toggle_play(self):
+        if self.sequencer.state.playing:
+            self.snd_engine.stop_scheduled()
+        self.sequencer.toggle_play()
+        return
+
     def set_bar(self, val):
         if self.sequencer.current_seq.size != 1:
             max_bar = self.sequencer.seq_play.shape[1] // 96
@@ -282,8 +290,7 @@ class Perform(Mode):
 
             # Need to add bank value to pad_idx for seq edit
             pad_idx += BANK_MAP[self.panel.bank_name]
-            if is_filled: # Remove from fill_rects
-                self.fill_rects.pop(is_filled[0])
+            if is_filled: # the edit invalidates fill_rects (see make_fill_rects)
                 self.sequencer.grid_edit(pad_idx, pulse, False, pitch)
             else:
                 self.sequencer.grid_edit(pad_idx, pulse, True, pitch)
@@ -339,9 +346,18 @@ class Perform(Mode):
         return None
 
     def make_fill_rects(self):
+        '''Rects of the filled cells of the shown bar and bank | cached until the sequence is edited'''
         sequencer = self.sequencer
         self.grid = self.grid_rects[self.sequencer.ac]
-        self.fill_rects = []
+
+        if sequencer.edits != self.fill_edits:
+            self.fill_cache.clear()
+            self.fill_edits = sequencer.edits
+
+        key = (sequencer.seq_num, self.bar, self.panel.bank_name, sequencer.tc)
+        self.fill_rects = self.fill_cache.get(key)
+        if self.fill_rects is not None:
+            return None
 
         #64 looks good | max 96 with large LCD @ 750
         steps = [4, 8, 12, 16, 24, 32, 48, 96]
@@ -359,14 +375,12 @@ class Perform(Mode):
 
         bar = self.bar
         m = BANK_MAP[self.panel.bank_name]
-        for i in range(m, m+8):
-            for j in range(96 * bar, 96 * (bar+1)):
-                if sequencer.seq_record[i, j][0]:
-                    left = xstart + (width/96)*(j-96*bar)
-                    top = ystart + (i%8)*rect_h
-                    rect = (left, top, rect_w, rect_h)
-                    self.fill_rects.append(pygame.Rect(rect))
-
+        tracks, pulses = np.nonzero(sequencer.seq_record['f0'][m:m+8, 96*bar:96*(bar+1)])
+        self.fill_rects = [
+            pygame.Rect((xstart + (width/96)*j, ystart + i*rect_h, rect_w, rect_h))
+            for i, j in zip(tracks.tolist(), pulses.tolist())
+        ]
+        self.fill_cache[key] = self.fill_rects
         return None
 
 
@@ -161,11 +161,13 @@ class Song(Mode):
         return
 
     # --------------------------------------------------------------------------
-    def update(self):
-        lcd = self.lcd
+    def poll(self):
         if self.sequencer.state.playing:
             self.song_update()
+        return
 
+    def update(self):
+        lcd = self.lcd
         if self.menu in ['del_song', 'name_song']:
             if self.menu == 'del_song':
                 to_blit, header_line = self.typer_update(
@@ -245,13 +247,15 @@ class Song(Mode):
         return
 
     def play_song(self):
+        if self.sequencer.state.playing:
+            self.snd_engine.stop_scheduled()
         self.sequencer.toggle_play(song=True, seq_list=self.current_song['seqs'])
         return
 
     def song_update(self):
-        check_seq, _ = self.sequencer.update()
-        if check_seq:
-            self.snd_engine.sequncer_play(self.sequencer, self.panel.banks)
+        ticks = self.sequencer.update()
+        if ticks:
+            self.snd_engine.sequncer_play(ticks, self.panel.banks)
         return
 
     # ----- Individual song
@@ -265,6 +265,7 @@ class Sounds(Mode):
 
         path = self.snd_engine.sounds[self.to_del]['path']
         path.unlink()
+        self.snd_engine.unset_pitches(self.to_del)
         del self.snd_engine.sounds[self.to_del]
 
         self.save_pad_config()
@@ -0,0 +1,49 @@
+#
+# -----------------------------------------------------------------------------
+# pyDM404 - A cross platform Drum Sequencer
+# File: render.py - render a sequence or song of a disk to a WAV file (no display/audio needed)
+#
+# Usage: python render.py DISKS/demo [--seq N | --song N] [--loops N] [--bpm BPM] [-o out.wav]
+# -----------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+from time import perf_counter
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1') # pygame is only used for its sndarray helpers
+from pydm.core import render
+from pydm.gui.editors import write_wave
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a pyDM404 sequence or song to a WAV file")
+    parser.add_argument('disk', help="disk directory, e.g. DISKS/demo")
+    what = parser.add_mutually_exclusive_group()
+    what.add_argument('--seq', type=int, default=0, help="sequence number (default 0)")
+    what.add_argument('--song', type=int, help="song number (renders the whole song)")
+    parser.add_argument('--loops', type=int, default=1, help="times to play the sequence")
+    parser.add_argument('--bpm', type=float, help="override the disk/song BPM")
+    parser.add_argument('--volume', type=float, default=1, help="master volume (default 1)")
+    parser.add_argument('--pitch-mode', choices=('nearest', 'linear'), default='nearest')
+    parser.add_argument('--no-tail', action='store_true', help="cut sounds at the end of the sequence")
+    parser.add_argument('-o', '--out', default='render.wav')
+    args = parser.parse_args()
+
+    start = perf_counter()
+    options = {'volume': args.volume, 'pitch_mode': args.pitch_mode, 'tail': not args.no_tail}
+    try:
+        if args.song is not None:
+            audio = render.render_song(args.disk, args.song, bpm=args.bpm, **options)
+        else:
+            audio = render.render_seq(args.disk, args.seq, args.loops, bpm=args.bpm, **options)
+    except (ValueError, IndexError, OSError) as e:
+        print(f"Render failed: {e}")
+        sys.exit(1)
+
+    write_wave(args.out, audio)
+    took = perf_counter() - start
+    length = audio.shape[0] / render.RATE
+    print(f"{args.out}: {length:.1f} s of audio in {took:.2f} s ({length / took:.0f}x realtime)")
+    sys.exit()
+
+#
@@ -0,0 +1,64 @@
+'''decode_wav must give the same samples as pygame.mixer.Sound (PitchStore keys hash the decoded data)
+Run with: python -m unittest discover tests
+'''
+from pathlib import Path
+import os
+import tempfile
+import unittest
+import wave
+
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import pygame
+
+from pydm.core.loader import decode_wav
+
+ROOT = Path(__file__).parent.parent
+
+
+class DecodeWavTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.mixer.pre_init(44100, -16, 2, 512)
+        pygame.mixer.init()
+        cls.freq, _, cls.channels = pygame.mixer.get_init()
+
+    @classmethod
+    def tearDownClass(cls):
+        pygame.mixer.quit()
+
+    def check(self, path):
+        expected = pygame.sndarray.array(pygame.mixer.Sound(str(path)))
+        data = decode_wav(path, self.freq, self.channels)
+        self.assertIsNotNone(data, path.name)
+        self.assertEqual(data.shape, expected.shape, path.name)
+        np.testing.assert_array_equal(data, expected, err_msg=path.name)
+
+    def test_bundled_wavs(self):
+        paths = sorted(ROOT.glob('assets/**/*.wav')) + sorted(ROOT.glob('DISKS/**/*.wav'))
+        self.assertTrue(paths)
+        for path in paths:
+            with self.subTest(path=path.name):
+                self.check(path)
+
+    def test_sample_formats(self):
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            for width in (1, 2, 3, 4):
+                for nchannels in (1, 2):
+                    for frames in (1000, 1003): # the last len % 8 samples are converted differently
+                        raw = rng.integers(0, 256, frames * nchannels * width, dtype=np.uint8).tobytes()
+                        path = Path(tmp) / f"w{width}_c{nchannels}_{frames}.wav"
+                        with wave.open(str(path), 'wb') as f:
+                            f.setnchannels(nchannels)
+                            f.setsampwidth(width)
+                            f.setframerate(self.freq)
+                            f.writeframes(raw)
+                        with self.subTest(path=path.name):
+                            self.check(path)
+
+
+if __name__ == '__main__':
+    unittest.main()